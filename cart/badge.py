@@ -0,0 +1,90 @@
+# cart/badge.py
+
+"""
+Счетчик корзины в шапке без загрузки самой корзины.
+
+Количество и сумма кладутся в маленькую cookie рядом с корзиной.
+Cookie привязана к id сессии (или к cookie корзины), поэтому после выхода
+или смены сессии старое значение не показывается - счетчик пересчитается.
+Значение только для показа, подделка cookie ни на что не влияет.
+"""
+
+import hashlib
+from decimal import Decimal
+
+from django.conf import settings
+
+from .stores import get_cart_store
+
+BADGE_COOKIE_NAME = 'cart_badge'
+
+
+def summarize(items):
+    """(количество, сумма) по словарю товаров корзины."""
+    count = sum(item['quantity'] for item in items.values())
+    total = sum(Decimal(item['price']) * item['quantity'] for item in items.values())
+    return count, total
+
+
+def _owner_token(owner):
+    if not owner:
+        return ''
+    return hashlib.md5(owner.encode('utf-8')).hexdigest()[:8]
+
+
+class CartBadge:
+    """count / total_price для шапки. Корзина загружается только если cookie нет."""
+
+    def __init__(self, request):
+        self.request = request
+        self._summary = None
+        self.recalculated = False
+
+    def _load(self):
+        if self._summary is not None:
+            return self._summary
+
+        store = get_cart_store(self.request)
+        if store.totals is not None:
+            # Итоги уже посчитаны в этом запросе (страница корзины, оформление)
+            self._summary = (store.totals.items_count, store.totals.items_total)
+            return self._summary
+
+        if store.changed:
+            # Корзину уже меняли в этом запросе - берем свежие данные
+            self._summary = summarize(store.get_state()['items'])
+            return self._summary
+
+        token = _owner_token(store.owner())
+        raw = self.request.COOKIES.get(BADGE_COOKIE_NAME, '')
+        try:
+            cookie_token, count, total = raw.split(':')
+            if cookie_token == token:
+                self._summary = (int(count), Decimal(total))
+                return self._summary
+        except:
+            pass
+
+        if not token:
+            # Ни сессии, ни корзины - считать нечего
+            self._summary = (0, Decimal('0'))
+        else:
+            self._summary = summarize(store.get_state()['items'])
+            self.recalculated = True
+        return self._summary
+
+    @property
+    def count(self):
+        return self._load()[0]
+
+    @property
+    def total_price(self):
+        return self._load()[1]
+
+
+def set_badge_cookie(response, owner, items):
+    count, total = summarize(items)
+    response.set_cookie(
+        BADGE_COOKIE_NAME, f'{_owner_token(owner)}:{count}:{total}',
+        max_age=settings.SESSION_COOKIE_AGE, samesite='Lax'
+    )
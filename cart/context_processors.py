@@ -1,10 +1,19 @@
 # cart/context_processors.py
 
+from django.utils.functional import SimpleLazyObject
+
+from .badge import CartBadge
 from .cart import Cart
 
 def cart(request):
     """
     Этот контекстный процессор делает объект 'cart' доступным
     во всех шаблонах, которые рендерятся через RequestContext.
+    Корзина создается только если шаблон к ней обратится.
+    Для шапки есть 'cart_badge' (количество и сумма без загрузки корзины).
     """
-    return {'cart': Cart(request)}
\ No newline at end of file
+    badge = request._cart_badge = CartBadge(request)
+    return {
+        'cart': SimpleLazyObject(lambda: Cart(request)),
+        'cart_badge': badge,
+    }
@@ -0,0 +1,26 @@
+# cart/middleware.py
+
+from .badge import set_badge_cookie
+
+
+class CartStoreMiddleware:
+    """
+    Дописывает в ответ cookie корзины (для хранилищ cookie и redis)
+    и счетчик для шапки. Если в запросе корзину не трогали, ничего не делает.
+
+    Стоит в MIDDLEWARE перед SessionMiddleware: ответ сюда приходит уже после
+    сохранения сессии, когда известен ее ключ.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        store = getattr(request, '_cart_store', None)
+        if store is not None:
+            response = store.process_response(response)
+            badge = getattr(request, '_cart_badge', None)
+            if store.changed or (badge is not None and badge.recalculated):
+                set_badge_cookie(response, store.owner(), store.get_state()['items'])
+        return response
@@ -0,0 +1,202 @@
+# cart/pricing.py
+
+"""
+Расчет итогов корзины за один проход.
+
+Товары загружаются одним запросом, промокод - одним запросом на запрос
+пользователя. Результат - неизменяемый снимок CartTotals, который
+используют страница корзины, AJAX-обработчики открыток и оформление заказа.
+
+Тем же запросом корзина сверяется с каталогом: цена из корзины против
+текущей Product.price, доступность и остаток. Отличия - в CartTotals.changes.
+"""
+
+from dataclasses import dataclass, replace
+from decimal import Decimal
+
+from shop.models import Product
+from promo.models import PromoCode
+
+ZERO = Decimal('0.00')
+
+
+def parse_price(value):
+    """Цена открытки из корзины ('150', '150,00 ₽') -> Decimal."""
+    try:
+        value = str(value).replace('₽', '').replace('руб', '').replace(',', '.').strip()
+        return Decimal(value) if value else ZERO
+    except:
+        return ZERO
+
+
+@dataclass(frozen=True)
+class CartLine:
+    product: Product
+    quantity: int
+    price: Decimal
+    total_price: Decimal
+    postcard_info: dict
+    postcard_price: Decimal
+    postcard_text: str
+    available_stock: int = 0
+
+    @property
+    def is_stock_sufficient(self):
+        return self.available_stock >= self.quantity
+
+    def as_dict(self):
+        """Позиция в старом формате Cart.__iter__ (словарь можно дополнять во view)."""
+        return {
+            'product': self.product,
+            'quantity': self.quantity,
+            'price': self.price,
+            'total_price': self.total_price,
+            'postcard_info': self.postcard_info,
+            'postcard_price': self.postcard_price,
+            'postcard_text': self.postcard_text,
+            'available_stock': self.available_stock,
+        }
+
+
+# Виды расхождений корзины с каталогом
+PRICE_CHANGED = 'price_changed'
+OUT_OF_STOCK = 'out_of_stock'
+REMOVED = 'removed'
+
+
+@dataclass(frozen=True)
+class CartChange:
+    kind: str
+    product_id: str
+    name: str = ''
+    old_price: Decimal = None
+    new_price: Decimal = None
+    quantity: int = 0
+    stock: int = 0
+
+    @property
+    def message(self):
+        if self.kind == PRICE_CHANGED:
+            return f"Цена товара «{self.name}» изменилась: {self.old_price} → {self.new_price} ₽"
+        if self.kind == OUT_OF_STOCK:
+            return f"Товара «{self.name}» осталось {self.stock} шт., в корзине {self.quantity}"
+        if self.name:
+            return f"Товар «{self.name}» больше не продается и убран из корзины"
+        return "Один из товаров больше не продается и убран из корзины"
+
+
+@dataclass(frozen=True)
+class CartTotals:
+    lines: tuple
+    items_count: int
+    items_total: Decimal
+    promo: PromoCode = None
+    discount: Decimal = ZERO
+    postcards_total: Decimal = ZERO
+    delivery: Decimal = ZERO
+    changes: tuple = ()
+
+    @property
+    def price_changes(self):
+        return [change for change in self.changes if change.kind == PRICE_CHANGED]
+
+    @property
+    def grand_total(self):
+        """Товары - Скидка + Открытки + Доставка"""
+        return self.items_total - self.discount + self.postcards_total + self.delivery
+
+    @property
+    def total_after_discount(self):
+        """К оплате без доставки (как Cart.get_total_price_after_discount)"""
+        return self.items_total - self.discount + self.postcards_total
+
+    @property
+    def is_stock_sufficient(self):
+        return all(line.is_stock_sufficient for line in self.lines)
+
+    def with_delivery(self, delivery):
+        return replace(self, delivery=Decimal(delivery))
+
+
+def load_promo(promo_id):
+    if not promo_id:
+        return None
+    try:
+        return PromoCode.objects.get(id=promo_id)
+    except PromoCode.DoesNotExist:
+        return None
+
+
+def calculate(items, postcards, postcard_texts, promo, held=None):
+    """
+    Считает снимок итогов. items - словарь товаров из состояния корзины,
+    held - {id товара: забронировано другими покупателями}.
+    Возвращает (CartTotals, исправления для корзины):
+    исправления - {'remove': [id, ...], 'prices': {id: новая цена}}.
+    Удаленные и снятые с продажи товары убираются, цены обновляются до текущих.
+    """
+    products = Product.objects.filter(id__in=items.keys()).prefetch_related('category')
+    product_map = {str(p.id): p for p in products}
+
+    lines = []
+    changes = []
+    fixes = {'remove': [], 'prices': {}}
+    items_count = 0
+    items_total = ZERO
+    postcards_total = ZERO
+
+    for item_id, item in items.items():
+        product = product_map.get(item_id)
+        if not product or not product.available:
+            fixes['remove'].append(item_id)
+            changes.append(CartChange(REMOVED, item_id, name=product.name if product else ''))
+            continue
+
+        price = Decimal(item['price'])
+        quantity = item['quantity']
+
+        if price != product.price:
+            changes.append(CartChange(
+                PRICE_CHANGED, item_id, name=product.name, old_price=price, new_price=product.price
+            ))
+            fixes['prices'][item_id] = product.price
+            price = product.price
+
+        available_stock = max(product.stock - (held or {}).get(product.id, 0), 0)
+        if available_stock < quantity:
+            changes.append(CartChange(
+                OUT_OF_STOCK, item_id, name=product.name, quantity=quantity, stock=available_stock
+            ))
+
+        postcard_info = postcards.get(item_id, {})
+        postcard_price = parse_price(postcard_info.get('price', '0')) if postcard_info else ZERO
+
+        lines.append(CartLine(
+            product=product,
+            quantity=quantity,
+            price=price,
+            total_price=price * quantity,
+            postcard_info=postcard_info,
+            postcard_price=postcard_price,
+            postcard_text=postcard_texts.get(item_id, item.get('postcard_text', '')),
+            available_stock=available_stock,
+        ))
+        items_count += quantity
+        items_total += price * quantity
+        postcards_total += postcard_price
+
+    discount = ZERO
+    if promo:
+        # (Процент / 100) * Общая сумма товаров (без учета открыток)
+        discount = (Decimal(promo.discount) / Decimal(100)) * items_total
+
+    totals = CartTotals(
+        lines=tuple(lines),
+        items_count=items_count,
+        items_total=items_total,
+        promo=promo,
+        discount=discount,
+        postcards_total=postcards_total,
+        changes=tuple(changes),
+    )
+    return totals, fixes
@@ -0,0 +1,282 @@
+# cart/stores.py
+
+"""
+Хранилища состояния корзины.
+
+Состояние - словарь:
+    items          - {id товара: {'quantity', 'price', 'postcard_text'}}
+    promo_id       - id примененного промокода или None
+    postcards      - {id товара: {'id', 'price', 'title'}}
+    postcard_texts - {id товара: текст открытки}
+
+session - как раньше, в сессии Django (таблица django_session).
+cookie  - в подписанной сжатой cookie, база не трогается совсем.
+          Корзина больше MAX_COOKIE_SIZE переезжает в сессию, пока снова не уменьшится.
+redis   - в Redis по случайному id из cookie.
+
+Выбор - settings.CART_STORE. Cookie хранилищ и счетчика в шапке
+записывает cart.middleware.CartStoreMiddleware.
+"""
+
+import json
+import logging
+import uuid
+
+from django.conf import settings
+from django.core import signing
+
+CART_COOKIE_AGE = 60 * 60 * 24 * 30  # 30 дней
+
+# Больше ~4 КБ браузеры cookie не сохраняют
+MAX_COOKIE_SIZE = 4000
+
+logger = logging.getLogger(__name__)
+
+
+def empty_state():
+    return {'items': {}, 'promo_id': None, 'postcards': {}, 'postcard_texts': {}}
+
+
+class BaseCartStore:
+
+    def __init__(self, request):
+        self.request = request
+        self.state = None
+        self.changed = False
+        # Итоги корзины и промокод, посчитанные в этом запросе (см. Cart.get_totals)
+        self.totals = None
+        self.promo_cache = None
+
+    def get_state(self):
+        """Состояние загружается один раз за запрос и общее для всех Cart(request)."""
+        if self.state is None:
+            self.state = self.load()
+        return self.state
+
+    def load(self):
+        raise NotImplementedError
+
+    def save(self, state):
+        raise NotImplementedError
+
+    def clear(self):
+        self.state = empty_state()
+        self.changed = True
+
+    def owner(self):
+        """Чья это корзина (значение cookie на момент ответа) - для счетчика в шапке."""
+        return self.request.COOKIES.get(settings.CART_COOKIE_NAME)
+
+    def process_response(self, response):
+        return response
+
+
+class SessionCartStore(BaseCartStore):
+    """Корзина в сессии. Ключи те же, что были у Cart раньше."""
+
+    KEYS = {
+        'items': settings.CART_SESSION_ID,
+        'promo_id': 'promo_id',
+        'postcards': 'postcards',
+        'postcard_texts': 'postcard_texts',
+    }
+
+    def load(self):
+        session = self.request.session
+        state = empty_state()
+        for name, key in self.KEYS.items():
+            value = session.get(key)
+            if value:
+                state[name] = value
+        return state
+
+    def save(self, state):
+        self.changed = True
+        session = self.request.session
+        for name, key in self.KEYS.items():
+            session[key] = state[name]
+        session.modified = True
+
+    def clear(self):
+        super().clear()
+        session = self.request.session
+        for key in self.KEYS.values():
+            if key in session:
+                del session[key]
+        session.modified = True
+
+    def owner(self):
+        return self.request.session.session_key
+
+
+class SignedCookieCartStore(BaseCartStore):
+    """
+    Корзина целиком в подписанной cookie (подделать цену нельзя - подпись).
+    Если корзина не помещается в cookie, она хранится в сессии (как SessionCartStore).
+    """
+
+    salt = 'cart.stores.cookie'
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.cookie_value = None
+        self.in_session = False
+
+    def _session_store(self):
+        return SessionCartStore(self.request)
+
+    def load(self):
+        raw = self.request.COOKIES.get(settings.CART_COOKIE_NAME)
+        state = empty_state()
+        if raw:
+            try:
+                data = signing.loads(raw, salt=self.salt, max_age=CART_COOKIE_AGE)
+                # Короткие ключи, чтобы cookie была меньше
+                state = {
+                    'items': data.get('i', {}),
+                    'promo_id': data.get('p'),
+                    'postcards': data.get('c', {}),
+                    'postcard_texts': data.get('t', {}),
+                }
+            except signing.BadSignature:
+                pass
+        else:
+            # Без cookie корзина могла переехать в сессию (сессия без cookie в БД не ходит)
+            session_state = self._session_store().load()
+            if session_state['items']:
+                self.in_session = True
+                state = session_state
+        return state
+
+    def _dumps(self, state):
+        data = {'i': state['items']}
+        if state['promo_id']:
+            data['p'] = state['promo_id']
+        if state['postcards']:
+            data['c'] = state['postcards']
+        if state['postcard_texts']:
+            data['t'] = state['postcard_texts']
+        return signing.dumps(data, salt=self.salt, compress=True)
+
+    def save(self, state):
+        # Размер проверяется здесь, а не в process_response: к ответу сессия уже сохранена
+        self.state = state
+        self.changed = True
+        value = self._dumps(state) if state['items'] else None
+        if value and len(value) > MAX_COOKIE_SIZE:
+            if not self.in_session:
+                logger.warning("Корзина не помещается в cookie (%s байт), хранится в сессии", len(value))
+            self._session_store().save(state)
+            self.in_session = True
+            self.cookie_value = None
+            return
+        if self.in_session:
+            self._session_store().clear()
+            self.in_session = False
+        self.cookie_value = value
+
+    def clear(self):
+        super().clear()
+        if self.in_session:
+            self._session_store().clear()
+            self.in_session = False
+        self.cookie_value = None
+
+    def owner(self):
+        if self.in_session:
+            return self.request.session.session_key
+        if self.changed:
+            return self.cookie_value
+        return super().owner()
+
+    def process_response(self, response):
+        if not self.changed:
+            return response
+
+        if not self.cookie_value:
+            response.delete_cookie(settings.CART_COOKIE_NAME)
+            return response
+
+        response.set_cookie(
+            settings.CART_COOKIE_NAME, self.cookie_value,
+            max_age=CART_COOKIE_AGE, httponly=True, samesite='Lax'
+        )
+        return response
+
+
+_redis = None
+
+
+def get_redis():
+    global _redis
+    if _redis is None:
+        import redis
+        _redis = redis.Redis.from_url(settings.REDIS_URL)
+    return _redis
+
+
+class RedisCartStore(BaseCartStore):
+    """Корзина в Redis, в cookie только случайный id."""
+
+    key_prefix = 'cart:'
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.cart_id = request.COOKIES.get(settings.CART_COOKIE_NAME)
+        self.new_id = False
+
+    def _key(self):
+        return self.key_prefix + self.cart_id
+
+    def load(self):
+        if not self.cart_id:
+            return empty_state()
+        raw = get_redis().get(self._key())
+        if not raw:
+            return empty_state()
+        state = empty_state()
+        state.update(json.loads(raw))
+        return state
+
+    def save(self, state):
+        self.state = state
+        self.changed = True
+        if not self.cart_id:
+            self.cart_id = uuid.uuid4().hex
+            self.new_id = True
+        get_redis().set(self._key(), json.dumps(state), ex=CART_COOKIE_AGE)
+
+    def clear(self):
+        super().clear()
+        if self.cart_id:
+            get_redis().delete(self._key())
+
+    def owner(self):
+        return self.cart_id
+
+    def process_response(self, response):
+        if self.new_id:
+            response.set_cookie(
+                settings.CART_COOKIE_NAME, self.cart_id,
+                max_age=CART_COOKIE_AGE, httponly=True, samesite='Lax'
+            )
+        return response
+
+
+STORES = {
+    'session': SessionCartStore,
+    'cookie': SignedCookieCartStore,
+    'redis': RedisCartStore,
+}
+
+
+def get_cart_store(request):
+    """Одно хранилище на запрос (несколько Cart(request) видят одно состояние)."""
+    store = getattr(request, '_cart_store', None)
+    if store is None:
+        name = getattr(settings, 'CART_STORE', 'session')
+        if name == 'redis' and not settings.REDIS_URL:
+            name = 'session'
+        store = STORES.get(name, SessionCartStore)(request)
+        request._cart_store = store
+    return store
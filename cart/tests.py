@@ -1,3 +1,47 @@
-from django.test import TestCase
+import secrets
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+
+from .stores import SignedCookieCartStore, empty_state
+
+
+class SignedCookieCartStoreTest(TestCase):
+    """Корзина, которая не помещается в cookie, не теряется, а хранится в сессии."""
+
+    def make_request(self, session, cookies=None):
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies or {})
+        request.session = session
+        return request
+
+    def make_state(self, count):
+        state = empty_state()
+        for i in range(count):
+            state['items'][str(i)] = {'quantity': 1, 'price': '1500.00', 'postcard_text': secrets.token_hex(40)}
+        return state
+
+    def test_oversized_cart_falls_back_to_session(self):
+        session = SessionStore()
+        big = self.make_state(100)
+
+        store = SignedCookieCartStore(self.make_request(session))
+        store.save(big)
+        response = store.process_response(HttpResponse())
+        self.assertEqual(response.cookies[settings.CART_COOKIE_NAME].value, '')
+
+        # Следующий запрос без cookie видит корзину из сессии
+        store = SignedCookieCartStore(self.make_request(session))
+        self.assertEqual(store.get_state()['items'], big['items'])
+
+        # Корзина уменьшилась - снова в cookie, из сессии удалена
+        small = self.make_state(1)
+        store.save(small)
+        response = store.process_response(HttpResponse())
+        value = response.cookies[settings.CART_COOKIE_NAME].value
+        self.assertNotIn(settings.CART_SESSION_ID, session)
+
+        store = SignedCookieCartStore(self.make_request(session, {settings.CART_COOKIE_NAME: value}))
+        self.assertEqual(store.get_state()['items'], small['items'])
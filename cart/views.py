@@ -3,10 +3,11 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.decorators.http import require_POST
 from shop.models import Product, Postcard
+from django.contrib import messages
 from .cart import Cart
+from .pricing import OUT_OF_STOCK
 from .forms import CartAddProductForm
 from django.http import JsonResponse
-from decimal import Decimal
 
 
 @require_POST
@@ -58,59 +59,17 @@ def cart_remove(request, product_id):
 
 def cart_detail(request):
     cart = Cart(request)
-    is_checkout_possible = True
-
-    # Рассчитываем общую стоимость открыток
-    postcards_total = Decimal('0.00')
-
-    for item in cart:
-        # Создаем форму для обновления количества
-        item['update_quantity_form'] = CartAddProductForm(
-            initial={'quantity': item['quantity'], 'update': True}
-        )
-
-        # Проверяем наличие товара на складе
-        product = item['product']
-        if product.stock < item['quantity']:
-            item['is_stock_sufficient'] = False
-            is_checkout_possible = False
-        else:
-            item['is_stock_sufficient'] = True
-
-        # Рассчитываем стоимость открытки для этого товара (ДОБАВЛЕНО)
-        if item.get('postcard_info') and 'price' in item['postcard_info']:
-            try:
-                postcard_price = Decimal(str(item['postcard_info']['price']))
-                item['postcard_price'] = postcard_price
-                postcards_total += postcard_price
-            except (ValueError, TypeError):
-                item['postcard_price'] = Decimal('0.00')
-        else:
-            item['postcard_price'] = Decimal('0.00')
-
-    # Получаем информацию о промокоде и скидке (ДОБАВЛЕНО)
-    promo_discount = Decimal('0.00')
-    promo_code = None
-    if cart.promo:
-        promo_discount = cart.get_discount()
-        promo_code = cart.promo.code
-
-    # Рассчитываем итоговую сумму с учетом открыток и промокода (ДОБАВЛЕНО)
-    total_items = cart.get_total_price()
-
-    if cart.promo:
-        total_after_discount = cart.get_total_price_after_discount() + postcards_total
-    else:
-        total_after_discount = total_items + postcards_total
+    # Все суммы и позиции считаются один раз (cart/pricing.py),
+    # заодно корзина сверяется с текущими ценами и наличием
+    totals = cart.get_totals()
+    for change in totals.changes:
+        if change.kind != OUT_OF_STOCK:  # нехватка остатка показывается у самого товара
+            messages.warning(request, change.message)
 
     return render(request, 'cart/detail.html', {
         'cart': cart,
-        'is_checkout_possible': is_checkout_possible,
-        'postcards_total': postcards_total,  # ДОБАВЛЕНО
-        'promo_discount': promo_discount,  # ДОБАВЛЕНО
-        'promo_code': promo_code,  # ДОБАВЛЕНО
-        'total_items': total_items,  # ДОБАВЛЕНО
-        'total_after_discount': total_after_discount,  # ДОБАВЛЕНО
+        'totals': totals,
+        'is_checkout_possible': totals.is_stock_sufficient,
     })
 
 
@@ -145,16 +104,12 @@ def add_postcard_to_cart(request, product_id):
             if request.headers.get('x-requested-with') == 'XMLHttpRequest':
                 if success:
                     # Пересчитываем итоги
-                    postcards_total = cart.get_postcard_total()
-                    if cart.promo:
-                        total_after = cart.get_total_price_after_discount() + postcards_total
-                    else:
-                        total_after = cart.get_total_price() + postcards_total
+                    totals = cart.get_totals()
 
                     return JsonResponse({
                         'success': True,
-                        'postcard_total': str(postcards_total),
-                        'total_after_discount': str(total_after),
+                        'postcard_total': str(totals.postcards_total),
+                        'total_after_discount': str(totals.total_after_discount),
                         'postcard_title': postcard.title,
                         'postcard_price': str(postcard.price)
                     })
@@ -182,16 +137,12 @@ def remove_postcard_from_cart(request, product_id):
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
         if success:
             # Пересчитываем итоги
-            postcards_total = cart.get_postcard_total()
-            if cart.promo:
-                total_after = cart.get_total_price_after_discount() + postcards_total
-            else:
-                total_after = cart.get_total_price() + postcards_total
+            totals = cart.get_totals()
 
             return JsonResponse({
                 'success': True,
-                'postcard_total': str(postcards_total),
-                'total_after_discount': str(total_after)
+                'postcard_total': str(totals.postcards_total),
+                'total_after_discount': str(totals.total_after_discount)
             })
         else:
             return JsonResponse({
@@ -217,12 +168,8 @@ def update_postcard_text(request, product_id):
 
     postcard_text = request.POST.get('postcard_text', '').strip()
 
-    # Сохраняем текст открытки в сессии
-    if 'postcard_texts' not in request.session:
-        request.session['postcard_texts'] = {}
-
-    request.session['postcard_texts'][product_id_str] = postcard_text
-    request.session.modified = True
+    # Сохраняем текст открытки в корзине
+    cart.update_postcard_text(product_id, postcard_text)
 
     return JsonResponse({
         'success': True,
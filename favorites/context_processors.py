@@ -1,6 +1,9 @@
 # favorites/context_processors.py
 
+from django.utils.functional import SimpleLazyObject
+
 from .favorites import Favorites
 
 def favorites(request):
-    return {'favorites': Favorites(request)}
\ No newline at end of file
+    # Сессия читается только если шаблон обратится к избранному
+    return {'favorites': SimpleLazyObject(lambda: Favorites(request))}
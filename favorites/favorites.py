@@ -7,10 +7,8 @@ from shop.models import Product
 class Favorites:
     def __init__(self, request):
         self.session = request.session
-        favorites = self.session.get(settings.FAVORITES_SESSION_ID)
-        if not favorites:
-            favorites = self.session[settings.FAVORITES_SESSION_ID] = []
-        self.favorites = favorites
+        # Пустой список в сессию не пишем: сессия меняется только при add/remove
+        self.favorites = self.session.get(settings.FAVORITES_SESSION_ID) or []
 
     def add(self, product):
         product_id = int(product.id)
@@ -25,6 +23,7 @@ class Favorites:
             self.save()
 
     def save(self):
+        self.session[settings.FAVORITES_SESSION_ID] = self.favorites
         self.session.modified = True
 
     def __iter__(self):
@@ -3,12 +3,16 @@
 from django.shortcuts import render, get_object_or_404
 from django.http import JsonResponse
 from shop.models import Product
+from shop.cards import build_product_cards
 from .favorites import Favorites
 
 
 def favorites_list(request):
     favorites = Favorites(request)
-    return render(request, 'favorites/list.html', {'favorites': favorites})
+    return render(request, 'favorites/list.html', {
+        'favorites': favorites,
+        'products': build_product_cards(favorites),
+    })
 
 
 def toggle_favorite(request):
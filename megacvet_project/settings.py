@@ -42,10 +42,12 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # Полнотекстовый и триграммный поиск (на SQLite не используется)
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'cart.middleware.CartStoreMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'shop.middleware.SiteTimezoneMiddleware',
@@ -116,6 +118,10 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
 CART_SESSION_ID = 'cart'
+# Где хранить корзину: 'session' (django_session), 'cookie' (подписанная cookie)
+# или 'redis' (нужен REDIS_URL). Cookie и Redis не обращаются к таблице сессий.
+CART_STORE = os.environ.get('CART_STORE', 'session')
+CART_COOKIE_NAME = 'cart'
 #LOGIN_REDIRECT_URL = '/'
 #LOGOUT_REDIRECT_URL = '/'
 ACCOUNT_LOGOUT_ON_GET = True
@@ -152,9 +158,59 @@ Q_CLUSTER = {
     'retry': 120,  # Через сколько секунд повторить упавшую задачу
     'max_attempts': 3, # Максимальное количество попыток
     'queue_limit': 50,
-    'orm': 'default', # Использовать стандартную БД Django для хранения задач
+    # Брокер ('redis' или 'orm') добавляется ниже, после REDIS_URL
 }
 
 FAVORITES_SESSION_ID = 'favorites'
 
+# --- IMAGEKIT ---
+# Превью создаются при сохранении фото товара, а не при первом показе.
+# Тогда .url не проверяет наличие файла на диске для каждой карточки.
+# Для уже загруженных фото один раз: python manage.py generateimages
+IMAGEKIT_DEFAULT_CACHEFILE_STRATEGY = 'imagekit.cachefiles.strategies.Optimistic'
+
+# --- КЭШ ---
+# Общий кэш нужен всем процессам (воркеры gunicorn + qcluster): через него
+# передается версия настроек сайта. Redis, если задан REDIS_URL, иначе файлы на диске.
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': BASE_DIR / 'cache',
+        }
+    }
 
+# Брокер очереди django-q. Redis, если задан REDIS_URL: постановка задач и опрос
+# очереди воркерами не идут в основную БД. Иначе - таблица django_q_ormq в БД.
+# Q_BROKER=orm / redis выбирает брокер явно (python manage.py benchmark_broker - сравнение).
+Q_BROKER = os.environ.get('Q_BROKER') or ('redis' if REDIS_URL else 'orm')
+if Q_BROKER == 'redis' and REDIS_URL:
+    Q_CLUSTER['redis'] = REDIS_URL
+else:
+    Q_BROKER = 'orm'
+    Q_CLUSTER['orm'] = 'default'  # Использовать стандартную БД Django для хранения задач
+
+
+# --- ПОИСК ---
+# 'postgres' - полнотекстовый поиск PostgreSQL, 'python' - индекс в памяти процесса.
+# Если не задано, выбирается по типу базы.
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND')
+
+# --- НОМЕРА ЗАКАЗОВ (orders/numbering.py) ---
+# 'sequence' - последовательность PostgreSQL, 'counter' - счетчик в таблице shop_counter.
+# Если не задано, выбирается по типу базы.
+ORDER_NUMBER_ALLOCATOR = os.environ.get('ORDER_NUMBER_ALLOCATOR')
+
+# --- БРОНИ ТОВАРОВ ПРИ ОФОРМЛЕНИИ (orders/holds.py) ---
+# На время оформления заказа количества из корзины бронируются для покупателя.
+# После изменения STOCK_HOLDS_ENABLED: python manage.py sync_stock_holds_schedule
+STOCK_HOLDS_ENABLED = os.environ.get('STOCK_HOLDS_ENABLED') == 'True'
+STOCK_HOLD_MINUTES = int(os.environ.get('STOCK_HOLD_MINUTES', 15))
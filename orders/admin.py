@@ -2,7 +2,8 @@
 
 from django.contrib import admin, messages
 from django import forms
-from .models import Order, OrderItem
+from .models import Order, OrderEvent, OrderItem, StockHold
+from . import outbox
 from django.urls import reverse, path
 from django.shortcuts import redirect
 from django.utils.html import format_html
@@ -53,8 +54,17 @@ class OrderAdmin(admin.ModelAdmin):
         'id',
         'first_name', 'last_name', 'email', 'phone',
         'recipient_name', 'recipient_phone', 'address',
-        'items__product__name', 'items__product__sku'
+        # Товары ищутся по строке items_search в самом заказе (без JOIN и DISTINCT)
+        'items_search',
     )
+    search_help_text = (
+        "Поиск по номеру, клиенту, получателю, адресу и товарам. Товары ищутся по названию "
+        "на момент заказа и текущему артикулу (обновляется при перенумерации артикулов)."
+    )
+
+    # Открытка и пользователь подгружаются одним запросом со списком
+    list_select_related = ('postcard', 'user')
+    list_per_page = 100
 
     # Статус можно менять прямо в списке
     list_editable = ['status']
@@ -593,7 +603,7 @@ class OrderAdmin(admin.ModelAdmin):
                 self.message_user(request, f'Нет валидного email у заказа #{order.id}', messages.WARNING)
                 return redirect(reverse('admin:orders_order_change', args=[object_id]))
 
-            async_task('orders.utils.send_status_update_email_task', order_id=order.id)
+            outbox.record(order, OrderEvent.STATUS_CHANGED)
             self.message_user(request, f'Уведомление о статусе заказа #{order.id} отправляется.', messages.SUCCESS)
         except Exception as e:
             self.message_user(request, f'Ошибка: {str(e)}', messages.ERROR)
@@ -608,12 +618,18 @@ class OrderAdmin(admin.ModelAdmin):
 
     def save_formset(self, request, form, formset, change):
         instances = formset.save(commit=False)
+        for obj in formset.deleted_objects:
+            obj.delete()
         for instance in instances:
             if isinstance(instance, OrderItem) and instance.product and (instance.price is None or instance.price == 0):
                 instance.price = instance.product.price
             instance.save()
         formset.save_m2m()
 
+        # Позиции изменились - пересчитываем сохраненные итоги заказа
+        if formset.model is OrderItem:
+            form.instance.recalculate_totals()
+
     def has_add_permission(self, request):
         return False
 
@@ -643,29 +659,41 @@ class OrderAdmin(admin.ModelAdmin):
 
     @admin.action(description='Отправить уведомление о статусе')
     def send_notification_to_selected(self, request, queryset):
-        for order in queryset:
-            async_task('orders.utils.send_status_update_email_task', order_id=order.id)
-        self.message_user(request, "Задачи на отправку уведомлений созданы.")
+        # События в исходящую очередь: письма уйдут одной пачкой через одно SMTP-соединение
+        outbox.record_many(queryset.only('id'), OrderEvent.STATUS_CHANGED)
+        self.message_user(request, "Задача на отправку уведомлений создана.")
 
     @admin.action(description='📧 Отправить подтверждение заказа')
     def send_confirmation_bulk(self, request, queryset):
-        count = 0
-        for order in queryset:
-            if order.email and 'no-email' not in order.email:
-                async_task('orders.utils.send_order_confirmation_email_task', order_id=order.id)
-                count += 1
-        self.message_user(request, f"Задачи на отправку подтверждений созданы для {count} заказов", messages.SUCCESS)
+        order_ids = [order.id for order in queryset.only('id', 'email') if order.email and 'no-email' not in order.email]
+        if order_ids:
+            async_task('orders.utils.send_order_confirmation_emails_task', order_ids=order_ids)
+        self.message_user(request, f"Задача на отправку подтверждений создана для {len(order_ids)} заказов", messages.SUCCESS)
 
     send_confirmation_bulk.short_description = "📧 Отправить подтверждение (повторно)"
 
     @admin.action(description='🔄 Отправить уведомление о статусе')
     def send_status_bulk(self, request, queryset):
-        count = 0
-        for order in queryset:
-            if order.email and 'no-email' not in order.email:
-                async_task('orders.utils.send_status_update_email_task', order_id=order.id)
-                count += 1
-        self.message_user(request, f"Задачи на отправку уведомлений о статусе созданы для {count} заказов",
+        orders = [order for order in queryset.only('id', 'email') if order.email and 'no-email' not in order.email]
+        outbox.record_many(orders, OrderEvent.STATUS_CHANGED)
+        self.message_user(request, f"Задача на отправку уведомлений о статусе создана для {len(orders)} заказов",
                           messages.SUCCESS)
 
-    send_status_bulk.short_description = "🔄 Уведомить о статусе (повторно)"
\ No newline at end of file
+    send_status_bulk.short_description = "🔄 Уведомить о статусе (повторно)"
+
+@admin.register(StockHold)
+class StockHoldAdmin(admin.ModelAdmin):
+    list_display = ('product', 'owner', 'quantity', 'expires_at')
+    list_select_related = ('product',)
+    search_fields = ('owner', 'product__name')
+
+
+@admin.register(OrderEvent)
+class OrderEventAdmin(admin.ModelAdmin):
+    list_display = ('order', 'kind', 'created', 'processed_at', 'attempts', 'last_error')
+    list_filter = ('kind', 'processed_at')
+    list_select_related = ('order',)
+    readonly_fields = (
+        'order', 'kind', 'payload', 'created', 'processed_at',
+        'attempts', 'sent_to', 'claimed_until', 'last_error',
+    )
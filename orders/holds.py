@@ -0,0 +1,124 @@
+# orders/holds.py
+
+"""
+Временные брони товаров на время оформления заказа (включается STOCK_HOLDS_ENABLED).
+
+Когда покупатель открывает оформление, количества из его корзины бронируются
+на STOCK_HOLD_MINUTES минут. Остаток в Product не меняется, но другим
+покупателям доступно stock минус чужие активные брони: корзина, карточка товара
+и списание при заказе (orders/stock.py) это учитывают.
+Просроченные брони пачкой удаляет задача django-q release_expired_holds.
+Ее расписание создается и удаляется по настройке командой
+    python manage.py sync_stock_holds_schedule
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from shop.models import Product
+from .models import StockHold
+
+
+def is_enabled():
+    return getattr(settings, 'STOCK_HOLDS_ENABLED', False)
+
+
+def owner_for(request):
+    """Кому принадлежат брони: пользователь или (для анонимов) сессия."""
+    if request.user.is_authenticated:
+        return f'user:{request.user.id}'
+    if request.session.session_key:
+        return f'session:{request.session.session_key}'
+    return None
+
+
+def held_by_others(product_ids, owner=None):
+    """{id товара: сколько забронировано другими} - один запрос."""
+    if not is_enabled() or not product_ids:
+        return {}
+    holds = StockHold.objects.filter(product_id__in=product_ids, expires_at__gt=timezone.now())
+    if owner:
+        holds = holds.exclude(owner=owner)
+    return {
+        row['product_id']: row['total']
+        for row in holds.values('product_id').annotate(total=Sum('quantity'))
+    }
+
+
+def free_stock(product, owner=None):
+    """Остаток товара за вычетом чужих броней."""
+    return max(product.stock - held_by_others([product.id], owner).get(product.id, 0), 0)
+
+
+def hold_cart(owner, quantities):
+    """
+    Бронирует {id товара: количество} для покупателя на STOCK_HOLD_MINUTES.
+    Старые брони покупателя заменяются. Бронируется не больше свободного остатка.
+    """
+    if not is_enabled() or not owner:
+        return
+
+    expires_at = timezone.now() + timedelta(minutes=settings.STOCK_HOLD_MINUTES)
+    product_ids = sorted(int(product_id) for product_id in quantities)
+
+    with transaction.atomic():
+        # Блокировка товаров в порядке id, чтобы две брони не разобрали один остаток
+        stock = dict(
+            Product.objects.select_for_update().filter(id__in=product_ids)
+            .order_by('id').values_list('id', 'stock')
+        )
+        StockHold.objects.filter(owner=owner).delete()
+        held = held_by_others(product_ids, owner)
+
+        holds = []
+        for product_id in product_ids:
+            free = stock.get(product_id, 0) - held.get(product_id, 0)
+            quantity = min(quantities.get(product_id, quantities.get(str(product_id), 0)), free)
+            if quantity > 0:
+                holds.append(StockHold(product_id=product_id, owner=owner, quantity=quantity, expires_at=expires_at))
+        StockHold.objects.bulk_create(holds)
+
+
+def release(owner):
+    """Снимает все брони покупателя (заказ оформлен)."""
+    if is_enabled() and owner:
+        StockHold.objects.filter(owner=owner).delete()
+
+
+def release_expired_holds():
+    """Задача django-q (расписание - sync_schedule): удаляет просроченные брони."""
+    if not is_enabled():
+        return 0
+    deleted, _ = StockHold.objects.filter(expires_at__lte=timezone.now()).delete()
+    if deleted:
+        print(f"Снято просроченных броней: {deleted}")
+    return deleted
+
+
+SCHEDULE_NAME = 'release_expired_stock_holds'
+
+
+def sync_schedule():
+    """
+    Создает расписание release_expired_holds (раз в минуту), если брони включены,
+    и удаляет его, если выключены. Возвращает True, если расписание есть.
+    """
+    from django_q.models import Schedule
+
+    if not is_enabled():
+        Schedule.objects.filter(name=SCHEDULE_NAME).delete()
+        return False
+    Schedule.objects.update_or_create(
+        name=SCHEDULE_NAME,
+        defaults={
+            'func': 'orders.holds.release_expired_holds',
+            'schedule_type': Schedule.MINUTES,
+            'minutes': 1,
+            'repeats': -1,
+        },
+    )
+    return True
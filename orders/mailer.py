@@ -0,0 +1,163 @@
+# orders/mailer.py
+
+"""
+Отправка писем о заказах.
+
+Раньше каждое письмо делало msg.send(): новое SMTP/TLS-соединение на
+каждое письмо (два на заказ), а массовые действия в админке ставили
+по задаче на заказ. Теперь:
+- у каждого воркера django-q одно SMTP-соединение, оно переиспользуется
+  между задачами и переоткрывается после простоя или обрыва;
+- задачи собирают письма пачкой и отправляют их одним соединением
+  (send_batch), массовые действия ставят одну задачу на все заказы;
+- если письмо на несколько адресов не ушло, оно повторяется по каждому
+  адресу отдельно, а неудачные адреса откладываются в расписание django-q.
+
+Соединение берется через django.core.mail.get_connection(), поэтому для
+проверки подходит любой локальный SMTP (aiosmtpd, EMAIL_HOST=localhost)
+или locmem-бэкенд в тестах.
+"""
+
+import atexit
+import smtplib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.utils import timezone
+
+# Сколько секунд простоя соединение считается живым (серверы рвут простаивающие)
+IDLE_TIMEOUT = 60
+
+# Попытки для одного адреса: первая сразу, остальные через RETRY_MINUTES * номер попытки
+MAX_ATTEMPTS = 4
+RETRY_MINUTES = 5
+
+# Ошибки, после которых соединение открывается заново
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError)
+
+_connection = None
+_last_used = 0.0
+
+
+def _get_connection():
+    global _connection, _last_used
+    now = time.monotonic()
+    if _connection is not None and now - _last_used > IDLE_TIMEOUT:
+        close()
+    if _connection is None:
+        _connection = get_connection(fail_silently=False)
+        _connection.open()
+    _last_used = now
+    return _connection
+
+
+def close():
+    """Закрывает соединение воркера (при выходе процесса или после ошибки)."""
+    global _connection
+    if _connection is not None:
+        try:
+            _connection.close()
+        except:
+            pass
+        _connection = None
+
+
+atexit.register(close)
+
+
+def build_message(subject, html, recipients):
+    msg = EmailMultiAlternatives(subject, '', settings.EMAIL_HOST_USER, list(recipients))
+    msg.attach_alternative(html, "text/html")
+    return msg
+
+
+def _html(message):
+    for content, mimetype in getattr(message, 'alternatives', []):
+        if mimetype == 'text/html':
+            return content
+    return message.body
+
+
+def for_recipient(message, recipient):
+    """Копия письма на один адрес."""
+    return build_message(message.subject, _html(message), [recipient])
+
+
+def _send(message):
+    """Одно письмо через общее соединение. При обрыве - одно переподключение."""
+    try:
+        return _get_connection().send_messages([message]) or 0
+    except CONNECTION_ERRORS:
+        close()
+        return _get_connection().send_messages([message]) or 0
+
+
+def send_message(message):
+    """
+    Одно письмо без повторов по адресам (повторы делает вызывающий, см. orders/outbox.py).
+    True, если письмо ушло. Ошибки SMTP пробрасываются.
+    """
+    try:
+        return bool(_send(message))
+    except Exception:
+        close()
+        raise
+
+
+def _schedule_retry(subject, html, recipient, attempt):
+    from django_q.models import Schedule
+    from django_q.tasks import schedule
+
+    schedule(
+        'orders.mailer.retry_recipient_task', subject, html, recipient, attempt,
+        name=f"Повтор письма ({attempt}) {time.time_ns()} {recipient}"[:100],
+        schedule_type=Schedule.ONCE,
+        next_run=timezone.now() + timedelta(minutes=RETRY_MINUTES * attempt),
+    )
+
+
+def _send_to_recipient(subject, html, recipient, attempt):
+    """Письмо на один адрес. Если не ушло - повтор по расписанию. True, если отправлено."""
+    try:
+        if _send(build_message(subject, html, [recipient])):
+            return True
+    except Exception as e:
+        close()
+        print(f"❌ Не удалось отправить письмо '{subject}' на {recipient} (попытка {attempt}): {e}")
+
+    if attempt < MAX_ATTEMPTS:
+        _schedule_retry(subject, html, recipient, attempt + 1)
+    else:
+        print(f"❌ Письмо '{subject}' на {recipient} не отправлено после {MAX_ATTEMPTS} попыток.")
+    return False
+
+
+def send_batch(messages):
+    """
+    Отправляет пачку писем одним соединением. Возвращает количество отправленных писем.
+    Письмо с ошибкой повторяется по каждому адресу отдельно.
+    """
+    sent = 0
+    for message in messages:
+        try:
+            if _send(message):
+                sent += 1
+                continue
+        except Exception as e:
+            print(f"❌ Ошибка отправки '{message.subject}': {e}")
+
+        html = _html(message)
+        delivered = [
+            recipient for recipient in message.recipients()
+            if _send_to_recipient(message.subject, html, recipient, attempt=1)
+        ]
+        if delivered:
+            sent += 1
+    return sent
+
+
+def retry_recipient_task(subject, html, recipient, attempt):
+    """Задача django-q: повторная отправка письма на один адрес."""
+    _send_to_recipient(subject, html, recipient, attempt)
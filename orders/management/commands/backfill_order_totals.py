@@ -0,0 +1,15 @@
+# orders/management/commands/backfill_order_totals.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from orders import totals
+from orders.models import Order, OrderItem
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сохраненные итоги (товары, скидка, итого) во всех заказах.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = totals.backfill(Order, OrderItem)
+        self.stdout.write(f"Готово! Итоги пересчитаны для {count} заказов.")
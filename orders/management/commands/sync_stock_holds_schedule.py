@@ -0,0 +1,14 @@
+# orders/management/commands/sync_stock_holds_schedule.py
+
+from django.core.management.base import BaseCommand
+from orders import holds
+
+
+class Command(BaseCommand):
+    help = 'Создает или удаляет расписание снятия просроченных броней по настройке STOCK_HOLDS_ENABLED.'
+
+    def handle(self, *args, **options):
+        if holds.sync_schedule():
+            self.stdout.write("Брони включены: просроченные брони снимаются раз в минуту.")
+        else:
+            self.stdout.write("Брони выключены: расписание снятия броней удалено.")
@@ -0,0 +1,31 @@
+# Generated by Django 4.2 on 2026-10-18 13:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0020_trigram_name_indexes'),
+        ('orders', '0006_order_postcard_final_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner', models.CharField(db_index=True, max_length=64, verbose_name='Покупатель')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='Действует до')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_holds', to='shop.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Бронь товара',
+                'verbose_name_plural': 'Брони товаров',
+                'indexes': [models.Index(fields=['product', 'expires_at'], name='orders_stoc_product_4229f0_idx')],
+            },
+        ),
+    ]
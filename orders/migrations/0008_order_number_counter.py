@@ -0,0 +1,39 @@
+# Generated by Django 4.2 on 2026-10-18 14:00
+
+from django.db import migrations
+from django.db.models import Max
+
+
+def seed_order_counter(apps, schema_editor):
+    # Счетчик номеров заказов продолжает с последнего существующего заказа
+    Order = apps.get_model('orders', 'Order')
+    Counter = apps.get_model('shop', 'Counter')
+    last_id = Order.objects.aggregate(Max('id'))['id__max'] or 0
+    Counter.objects.update_or_create(name='order_number', defaults={'value': last_id})
+    # Заказы вставлялись с явным id, последовательность PostgreSQL так и осталась
+    # в начале - подтягиваем ее к последнему заказу (как orders.numbering.sync_sequence)
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        # Для пустой таблицы is_called = false: nextval() вернет 1
+        cursor.execute(
+            "SELECT setval(pg_get_serial_sequence('orders_order', 'id'), %s, %s)",
+            [max(last_id, 1), last_id > 0],
+        )
+
+
+def delete_order_counter(apps, schema_editor):
+    Counter = apps.get_model('shop', 'Counter')
+    Counter.objects.filter(name='order_number').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0021_counter'),
+        ('orders', '0007_stockhold'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_order_counter, delete_order_counter),
+    ]
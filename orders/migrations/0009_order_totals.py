@@ -0,0 +1,60 @@
+# Generated by Django 4.2 on 2026-10-18 15:00
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+
+MONEY = models.DecimalField(max_digits=10, decimal_places=2)
+
+
+def backfill_totals(apps, schema_editor):
+    # Заполняем итоги для уже существующих заказов (то же делает команда backfill_order_totals).
+    # Копия orders.totals.backfill: миграция не зависит от текущего кода приложения
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+
+    items_total = OrderItem.objects.filter(order=OuterRef('pk')).values('order').annotate(
+        total=Sum(ExpressionWrapper(F('price') * F('quantity'), output_field=MONEY))
+    ).values('total')
+
+    orders = Order.objects.all()
+    orders.update(items_total=Coalesce(Subquery(items_total, output_field=MONEY), Value(Decimal('0.00'))))
+    orders.update(discount_amount=Round(
+        ExpressionWrapper(F('items_total') * F('discount') / Value(Decimal(100)), output_field=MONEY), 2
+    ))
+    orders.update(grand_total=ExpressionWrapper(
+        F('items_total') - F('discount_amount') + F('delivery_cost') + F('postcard_final_price'),
+        output_field=MONEY,
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_order_number_counter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='items_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Стоимость товаров'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='discount_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Сумма скидки'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='grand_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Итого'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created', 'grand_total'], name='orders_orde_created_65f690_idx'),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2 on 2026-10-18 15:30
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def fill_items_search(apps, schema_editor):
+    # Строка поиска по товарам для уже существующих заказов
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+
+    texts = {}
+    for order_id, name, sku in OrderItem.objects.values_list('order_id', 'product__name', 'product__sku').iterator():
+        texts.setdefault(order_id, []).append(f"{name} {sku or ''}".strip())
+
+    # Пачками: id__in по всем заказам сразу не влезает в лимит параметров SQLite
+    order_ids = sorted(texts)
+    for i in range(0, len(order_ids), BATCH_SIZE):
+        orders = list(Order.objects.filter(id__in=order_ids[i:i + BATCH_SIZE]).only('id'))
+        for order in orders:
+            order.items_search = ' '.join(texts[order.id])
+        Order.objects.bulk_update(orders, ['items_search'], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_order_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='items_search',
+            field=models.TextField(blank=True, editable=False, verbose_name='Товары (для поиска)'),
+        ),
+        migrations.RunPython(fill_items_search, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2 on 2026-10-18 16:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_dispatch_schedule(apps, schema_editor):
+    # Страховка: раз в минуту разбираем события, для которых задача не поставилась
+    Schedule = apps.get_model('django_q', 'Schedule')
+    Schedule.objects.update_or_create(
+        name='dispatch_order_events',
+        defaults={
+            'func': 'orders.outbox.dispatch',
+            'schedule_type': 'I',
+            'minutes': 1,
+            'repeats': -1,
+        },
+    )
+
+
+def delete_dispatch_schedule(apps, schema_editor):
+    Schedule = apps.get_model('django_q', 'Schedule')
+    Schedule.objects.filter(name='dispatch_order_events').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_q', '0018_task_success_index'),
+        ('orders', '0010_order_items_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('created', 'Заказ оформлен'), ('cancelled', 'Заказ отменен'), ('status_changed', 'Статус изменен')], max_length=20, verbose_name='Событие')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='Данные')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Обработано')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='orders.order', verbose_name='Заказ')),
+            ],
+            options={
+                'verbose_name': 'Событие заказа',
+                'verbose_name_plural': 'События заказов',
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['id'], name='orders_event_pending_idx')],
+            },
+        ),
+        migrations.RunPython(create_dispatch_schedule, delete_dispatch_schedule),
+    ]
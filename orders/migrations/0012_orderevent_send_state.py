@@ -0,0 +1,33 @@
+# Generated by Django 4.2 on 2026-10-18 17:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_orderevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderevent',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Попыток отправки'),
+        ),
+        migrations.AddField(
+            model_name='orderevent',
+            name='sent_to',
+            field=models.JSONField(blank=True, default=list, verbose_name='Доставлено'),
+        ),
+        migrations.AddField(
+            model_name='orderevent',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Занято до'),
+        ),
+        migrations.AddField(
+            model_name='orderevent',
+            name='last_error',
+            field=models.TextField(blank=True, verbose_name='Последняя ошибка'),
+        ),
+    ]
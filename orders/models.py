@@ -1,12 +1,13 @@
 # orders/models.py
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from shop.models import Product, Postcard, SiteSettings
 from django.contrib.auth.models import User
 from decimal import Decimal
-from django.db.models import Max
 from promo.models import PromoCode
 
+from . import numbering
+
 
 class Order(models.Model):
     # Поля для промокодов
@@ -72,6 +73,16 @@ class Order(models.Model):
 
     is_one_click = models.BooleanField("Заказ в 1 клик", default=False)
 
+    # Итоги заказа хранятся в строке (для списков, писем и отчетов без запросов к позициям).
+    # items_total пересчитывается при создании заказа и сохранении позиций (recalculate_totals),
+    # скидка и итог - при каждом save() из items_total.
+    items_total = models.DecimalField("Стоимость товаров", max_digits=10, decimal_places=2, default=0)
+    discount_amount = models.DecimalField("Сумма скидки", max_digits=10, decimal_places=2, default=0)
+    grand_total = models.DecimalField("Итого", max_digits=10, decimal_places=2, default=0)
+
+    # Названия и артикулы товаров заказа одной строкой - поиск в админке без JOIN по позициям
+    items_search = models.TextField("Товары (для поиска)", blank=True, editable=False)
+
     def save(self, *args, **kwargs):
         # ИСПРАВЛЕНО: Всегда берем цену из связанной открытки если есть
         if self.postcard:
@@ -88,22 +99,31 @@ class Order(models.Model):
             # Если открытки нет, цена = 0
             self.postcard_final_price = Decimal('0.00')
 
-        if not self.id:
-            try:
-                start_num = SiteSettings.get_solo().order_start_number
-            except:
-                start_num = 1
-
-            max_id_dict = Order.objects.aggregate(Max('id'))
-            max_id = max_id_dict['id__max'] or 0
-
-            self.id = max(max_id + 1, start_num)
-
-        super().save(*args, **kwargs)
+        self._update_totals()
+
+        if self.id:
+            super().save(*args, **kwargs)
+            return
+
+        # Номер из последовательности / счетчика (orders/numbering.py), без MAX(id).
+        # force_insert: занятый номер дает IntegrityError, а не UPDATE чужого заказа
+        self.id = numbering.next_order_number()
+        kwargs['force_insert'] = True
+        try:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+        except IntegrityError:
+            if not Order.objects.filter(pk=self.id).exists():
+                raise
+            self.id = numbering.recover_number()
+            super().save(*args, **kwargs)
 
     class Meta:
         ordering = ['-created']
-        indexes = [models.Index(fields=['-created']), ]
+        indexes = [
+            models.Index(fields=['-created']),
+            models.Index(fields=['created', 'grand_total']),
+        ]
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
 
@@ -114,37 +134,73 @@ class Order(models.Model):
     def can_be_cancelled(self):
         return self.status in ['created', 'processing']
 
+    def _update_totals(self):
+        """Скидка и итог из сохраненной стоимости товаров (без запросов)."""
+        items_total = Decimal(self.items_total or 0).quantize(Decimal('0.01'))
+        discount_amount = Decimal(0)
+        if self.discount > 0:
+            discount_amount = (items_total * (Decimal(self.discount) / Decimal(100))).quantize(Decimal('0.01'))
+        self.items_total = items_total
+        self.discount_amount = discount_amount
+        self.grand_total = (
+            items_total - discount_amount + Decimal(self.delivery_cost) + Decimal(self.postcard_final_price)
+        ).quantize(Decimal('0.01'))
+
+    @staticmethod
+    def build_items_search(products):
+        """Строка для поиска по товарам заказа: 'Название Артикул Название Артикул ...'"""
+        return ' '.join(f"{product.name} {product.sku or ''}".strip() for product in products)
+
+    @classmethod
+    def refresh_items_search(cls, batch_size=500):
+        """
+        Пересобирает items_search всех заказов (после перенумерации артикулов).
+        Возвращает количество заказов.
+        """
+        texts = {}
+        items = OrderItem.objects.values_list('order_id', 'product__name', 'product__sku').order_by('order_id', 'id')
+        for order_id, name, sku in items.iterator():
+            texts.setdefault(order_id, []).append(f"{name} {sku or ''}".strip())
+
+        # Пачками: id__in по всем заказам сразу не влезает в лимит параметров SQLite
+        order_ids = sorted(texts)
+        for i in range(0, len(order_ids), batch_size):
+            orders = list(cls.objects.filter(id__in=order_ids[i:i + batch_size]).only('id'))
+            for order in orders:
+                order.items_search = ' '.join(texts[order.id])
+            cls.objects.bulk_update(orders, ['items_search'], batch_size=batch_size)
+        return len(order_ids)
+
+    def recalculate_totals(self, save=True):
+        """Пересчитывает стоимость товаров и строку поиска по позициям (после изменения позиций)."""
+        self.items_total = self.items.aggregate(
+            total=models.Sum(models.F('price') * models.F('quantity'))
+        )['total'] or Decimal(0)
+        self.items_search = self.build_items_search(Product.objects.filter(order_items__order=self))
+        self._update_totals()
+        if save:
+            Order.objects.filter(id=self.id).update(
+                items_total=self.items_total,
+                discount_amount=self.discount_amount,
+                grand_total=self.grand_total,
+                items_search=self.items_search,
+            )
+
     def get_items_cost(self):
-        """ИСПРАВЛЕНО: Стоимость товаров с округлением"""
-        total = sum(item.get_cost() for item in self.items.all())
-        return total.quantize(Decimal('0.01'))
+        """Стоимость товаров (сохраненная в заказе)"""
+        return self.items_total
 
     def get_discount_amount(self):
-        """ИСПРАВЛЕНО: Возвращает сумму скидки в рублях с округлением"""
-        if self.discount > 0:
-            discount = self.get_items_cost() * (Decimal(self.discount) / Decimal(100))
-            return discount.quantize(Decimal('0.01'))
-        return Decimal(0)
+        """Сумма скидки в рублях (сохраненная в заказе)"""
+        return self.discount_amount
 
     def get_postcard_cost(self):
         """ИСПРАВЛЕНО: Возвращает стоимость открытки из сохраненного поля"""
         return self.postcard_final_price
 
     def get_total_cost(self):
-        """ИСПРАВЛЕНО: Полная стоимость заказа с учетом открытки и округлением"""
-        total_items = self.get_items_cost()
-
-        # 1. Вычитаем скидку
-        discount_amount = self.get_discount_amount()
-        total = total_items - discount_amount
-
-        # 2. Добавляем доставку
-        total += self.delivery_cost
-
-        # 3. Добавляем открытку
-        total += self.get_postcard_cost()
-
-        return total.quantize(Decimal('0.01'))
+        """Полная стоимость: Товары - Скидка + Доставка + Открытка (сохраненная в заказе)"""
+        return self.grand_total
 
     def get_delivery_time_display(self):
         """Красивое отображение времени доставки"""
@@ -203,4 +259,65 @@ class OrderItem(models.Model):
     def get_cost(self):
         if self.price is None or self.quantity is None:
             return Decimal('0.00')
-        return (self.price * self.quantity).quantize(Decimal('0.01'))
\ No newline at end of file
+        return (self.price * self.quantity).quantize(Decimal('0.01'))
+
+class StockHold(models.Model):
+    """
+    Временная бронь остатка на время оформления заказа (см. orders/holds.py).
+    Остаток товара не уменьшается: свободно = stock - активные брони других покупателей.
+    """
+    product = models.ForeignKey(Product, related_name='stock_holds', on_delete=models.CASCADE, verbose_name="Товар")
+    owner = models.CharField("Покупатель", max_length=64, db_index=True)
+    quantity = models.PositiveIntegerField("Количество")
+    expires_at = models.DateTimeField("Действует до", db_index=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Бронь товара'
+        verbose_name_plural = 'Брони товаров'
+        indexes = [
+            models.Index(fields=['product', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} x {self.quantity} ({self.owner})"
+
+
+class OrderEvent(models.Model):
+    """
+    Событие заказа в исходящей очереди (transactional outbox, см. orders/outbox.py).
+    Пишется в той же транзакции, что и сам заказ; письма отправляет диспетчер после коммита.
+    """
+    CREATED = 'created'
+    CANCELLED = 'cancelled'
+    STATUS_CHANGED = 'status_changed'
+    KIND_CHOICES = [
+        (CREATED, 'Заказ оформлен'),
+        (CANCELLED, 'Заказ отменен'),
+        (STATUS_CHANGED, 'Статус изменен'),
+    ]
+
+    order = models.ForeignKey(Order, related_name='events', on_delete=models.CASCADE, verbose_name="Заказ")
+    kind = models.CharField("Событие", max_length=20, choices=KIND_CHOICES)
+    payload = models.JSONField("Данные", default=dict, blank=True)
+    created = models.DateTimeField("Создано", auto_now_add=True)
+    processed_at = models.DateTimeField("Обработано", null=True, blank=True)
+    # Состояние отправки: диспетчер занимает событие до claimed_until и отправляет письма
+    # вне транзакции, по одному адресу. sent_to - ключи уже доставленных писем
+    # ("адрес тема"), при повторе они не отправляются.
+    attempts = models.PositiveSmallIntegerField("Попыток отправки", default=0)
+    sent_to = models.JSONField("Доставлено", default=list, blank=True)
+    claimed_until = models.DateTimeField("Занято до", null=True, blank=True)
+    last_error = models.TextField("Последняя ошибка", blank=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = 'Событие заказа'
+        verbose_name_plural = 'События заказов'
+        indexes = [
+            # Диспетчер выбирает только необработанные события
+            models.Index(fields=['id'], condition=models.Q(processed_at__isnull=True), name='orders_event_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.order_id}"
@@ -0,0 +1,113 @@
+# orders/numbering.py
+
+"""
+Выдача номеров заказов (номер заказа = его id).
+
+Раньше Order.save() брал MAX(id) + 1: чтение индекса на каждый заказ,
+и два одновременных заказа могли получить один номер.
+Теперь номер выдается за O(1) и без повторов:
+- 'sequence' - последовательность PostgreSQL столбца orders_order.id;
+- 'counter'  - атомарный счетчик в строке shop_counter (SQLite и другие базы).
+В обоих случаях учитывается SiteSettings.order_start_number.
+"""
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+
+from shop import counters
+from shop.models import SiteSettings
+
+COUNTER_NAME = 'order_number'
+
+# Ключ advisory-блокировки для подтягивания последовательности к начальному номеру
+SEQUENCE_LOCK_KEY = 72114
+
+SEQUENCE_SQL = "pg_get_serial_sequence('orders_order', 'id')"
+
+
+def start_number():
+    try:
+        return SiteSettings.get_solo().order_start_number or 1
+    except:
+        return 1
+
+
+def get_allocator():
+    name = getattr(settings, 'ORDER_NUMBER_ALLOCATOR', None)
+    if name not in ('sequence', 'counter'):
+        name = 'sequence' if connection.vendor == 'postgresql' else 'counter'
+    return name
+
+
+def _sequence_next(start):
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT nextval({SEQUENCE_SQL})")
+        number = cursor.fetchone()[0]
+        if number >= start:
+            return number
+
+        # Начальный номер в настройках больше текущего значения последовательности.
+        # Под блокировкой, чтобы два воркера не выдали start_num дважды.
+        with transaction.atomic():
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [SEQUENCE_LOCK_KEY])
+            cursor.execute(f"SELECT nextval({SEQUENCE_SQL})")
+            number = cursor.fetchone()[0]
+            if number < start:
+                cursor.execute(f"SELECT setval({SEQUENCE_SQL}, %s)", [start])
+                number = start
+        return number
+
+
+def sync_sequence(db_connection, last_id):
+    """Следующий nextval() вернет last_id + 1 (только PostgreSQL)."""
+    if db_connection.vendor != 'postgresql':
+        return
+    with db_connection.cursor() as cursor:
+        # Для пустой таблицы is_called = false: nextval() вернет 1
+        cursor.execute(f"SELECT setval({SEQUENCE_SQL}, %s, %s)", [max(last_id, 1), last_id > 0])
+
+
+def _last_order_id():
+    from .models import Order
+    return Order.objects.aggregate(Max('id'))['id__max'] or 0
+
+
+def next_order_number():
+    """Номер для нового заказа."""
+    start = start_number()
+    if get_allocator() == 'sequence':
+        return _sequence_next(start)
+    return counters.allocate(COUNTER_NAME, floor=start, seed=_last_order_id)
+
+
+def recover_number():
+    """
+    Выданный номер оказался занят: последовательность или счетчик отстали от
+    существующих заказов (заказы вставлялись с явным id). Подтягивает их к MAX(id)
+    и выдает следующий номер. MAX(id) читается только здесь, не на каждом заказе.
+    """
+    start = start_number()
+    if get_allocator() != 'sequence':
+        counters.advance(COUNTER_NAME, _last_order_id())
+        return counters.allocate(COUNTER_NAME, floor=start, seed=_last_order_id)
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [SEQUENCE_LOCK_KEY])
+            floor = max(start, _last_order_id() + 1)
+            cursor.execute(f"SELECT nextval({SEQUENCE_SQL})")
+            number = cursor.fetchone()[0]
+            if number < floor:
+                cursor.execute(f"SELECT setval({SEQUENCE_SQL}, %s)", [floor])
+                number = floor
+    return number
+
+
+def sync():
+    """
+    Подгоняет счетчик под существующие заказы (после перенумерации fix_order_ids).
+    """
+    last_id = _last_order_id()
+    sync_sequence(connection, last_id)
+    counters.set_value(COUNTER_NAME, last_id)
@@ -0,0 +1,176 @@
+# orders/outbox.py
+
+"""
+Исходящая очередь событий заказов (transactional outbox).
+
+Раньше order_create вызывал async_task() внутри @transaction.atomic:
+на ORM-брокере запись задачи шла в той же транзакции, а воркер мог взять
+id заказа, который еще не закоммичен. Теперь во время транзакции пишется
+только строка OrderEvent. После коммита ставится одна задача dispatch(),
+которая забирает события пачками и отправляет письма одним соединением.
+Если задача не поставилась, события заберет ежеминутное расписание
+(миграция 0011).
+
+Диспетчер в короткой транзакции занимает пачку событий (SKIP LOCKED на Postgres)
+до claimed_until, а письма отправляет уже вне транзакции, по одному событию.
+Каждое событие помечается по своему результату: отправлено - processed_at,
+ошибка - last_error и повтор через RETRY_MINUTES * номер попытки. Письма уходят
+на каждый адрес отдельно, и каждая доставка сразу записывается в sent_to:
+при повторе получают письмо только те адреса, на которые оно не ушло
+(в том числе если диспетчер упал посреди события). Если диспетчер упал
+посреди пачки, события снова станут доступны, когда истечет claimed_until.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from shop.models import SiteSettings
+from . import mailer, snapshot, utils
+from .models import OrderEvent
+
+BATCH_SIZE = 100
+
+# На сколько диспетчер занимает пачку (дольше, чем отправка пачки)
+CLAIM_MINUTES = 10
+
+# Попытки отправки события: повтор через RETRY_MINUTES * номер попытки
+MAX_ATTEMPTS = 5
+RETRY_MINUTES = 5
+
+# Какие письма собираются для события: функция из orders/utils.py и нужен ли base_url
+MESSAGE_BUILDERS = {
+    OrderEvent.CREATED: (utils.order_creation_messages, True),
+    OrderEvent.CANCELLED: (utils.cancellation_messages, True),
+    OrderEvent.STATUS_CHANGED: (utils.status_update_messages, False),
+}
+
+
+def enqueue_dispatch():
+    from django_q.tasks import async_task
+    try:
+        async_task('orders.outbox.dispatch')
+    except Exception as e:
+        # Не страшно: события заберет расписание
+        print(f"Не удалось поставить отправку событий в очередь: {e}")
+
+
+def record(order, kind, **payload):
+    """
+    Записывает событие заказа. Вызывается внутри транзакции, которая меняет заказ;
+    задача отправки ставится только после коммита (при откате - не ставится).
+    """
+    event = OrderEvent.objects.create(order=order, kind=kind, payload=payload)
+    transaction.on_commit(enqueue_dispatch)
+    return event
+
+
+def record_many(orders, kind, **payload):
+    """То же для нескольких заказов: один INSERT и одна задача отправки."""
+    with transaction.atomic():
+        events = OrderEvent.objects.bulk_create([OrderEvent(order=order, kind=kind, payload=payload) for order in orders])
+        if events:
+            transaction.on_commit(enqueue_dispatch)
+    return events
+
+
+def _claim(batch_size):
+    """Занимает пачку событий для отправки. Короткая транзакция: только SELECT и UPDATE."""
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            OrderEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True)
+            .filter(Q(claimed_until__isnull=True) | Q(claimed_until__lte=now))
+            .order_by('id')[:batch_size]
+        )
+        if events:
+            OrderEvent.objects.filter(id__in=[event.id for event in events]).update(
+                claimed_until=now + timedelta(minutes=CLAIM_MINUTES), attempts=F('attempts') + 1,
+            )
+    for event in events:
+        event.attempts += 1
+    return events
+
+
+def _messages(event, order, site):
+    if order is None:
+        raise LookupError(f"Заказ {event.order_id} не найден")
+    build, needs_base_url = MESSAGE_BUILDERS[event.kind]
+    args = (event.payload.get('base_url', ''),) if needs_base_url else ()
+    return build(order, site, *args)
+
+
+def _delivery_key(message, recipient):
+    # Письмо определяется адресом и темой, а не номером в списке: письма события
+    # собираются заново при каждой попытке, и их набор может измениться
+    return f'{recipient} {message.subject}'
+
+
+def _send_event(event, order, site):
+    """
+    Отправляет письма события по одному адресу, пропуская уже доставленные.
+    Ошибка по одному адресу не мешает остальным; если были ошибки - исключение.
+    """
+    failed = {}
+    for message in _messages(event, order, site):
+        for recipient in message.recipients():
+            key = _delivery_key(message, recipient)
+            if key in event.sent_to:
+                continue
+            try:
+                if not mailer.send_message(mailer.for_recipient(message, recipient)):
+                    raise RuntimeError("письмо не принято сервером")
+            except Exception as e:
+                failed[recipient] = str(e)
+                continue
+            event.sent_to.append(key)
+            OrderEvent.objects.filter(id=event.id).update(sent_to=event.sent_to)
+    if failed:
+        raise RuntimeError(f"Не доставлено: {failed}")
+
+
+def _mark_failed(event, error):
+    now = timezone.now()
+    if event.attempts >= MAX_ATTEMPTS:
+        # Больше не повторяем: событие закрыто, ошибка видна в админке
+        update = {'processed_at': now, 'claimed_until': None}
+    else:
+        update = {'claimed_until': now + timedelta(minutes=RETRY_MINUTES * event.attempts)}
+    OrderEvent.objects.filter(id=event.id).update(last_error=str(error)[:1000], **update)
+
+
+def dispatch_batch(batch_size=BATCH_SIZE):
+    """Обрабатывает одну пачку событий. Возвращает количество занятых событий."""
+    site = snapshot.site_snapshot(SiteSettings.get_solo())
+    events = _claim(batch_size)
+    if not events:
+        return 0
+
+    # Снимки заказов всей пачки - двумя запросами, письма - вне транзакции
+    snapshots = snapshot.load_many([event.order_id for event in events], site)
+    sent = 0
+    for event in events:
+        try:
+            _send_event(event, snapshots.get(event.order_id), site)
+        except Exception as e:
+            print(f"❌ Событие #{event.id} ({event.kind}, заказ #{event.order_id}), попытка {event.attempts}: {e}")
+            _mark_failed(event, e)
+            continue
+        OrderEvent.objects.filter(id=event.id).update(processed_at=timezone.now(), claimed_until=None, last_error='')
+        sent += 1
+
+    print(f"✅ События заказов: {len(events)}, отправлено: {sent}")
+    return len(events)
+
+
+def dispatch(batch_size=BATCH_SIZE):
+    """Задача django-q: разбирает очередь событий пачками до конца."""
+    total = 0
+    while True:
+        processed = dispatch_batch(batch_size)
+        total += processed
+        if processed < batch_size:
+            return total
@@ -0,0 +1,122 @@
+# orders/slots.py
+
+"""
+Календарь интервалов доставки / самовывоза.
+
+Раньше каждый выбор даты в календаре заново загружал настройки, строил
+pytz-время и проходил цикл интервалов. Теперь сетка интервалов на
+CALENDAR_DAYS дней вперед строится один раз и лежит в кэше. Ключ кэша
+содержит версию настроек сайта (shop/settings_cache.py), поэтому после
+сохранения настроек сетка строится заново. На запрос остается только
+отсечь интервалы сегодняшнего дня раньше "сейчас + время на сборку".
+"""
+
+import datetime
+
+import pytz
+from django.core.cache import cache
+from django.utils import timezone
+
+from shop import settings_cache
+from shop.models import SiteSettings
+from .utils import build_day_slots
+
+# На сколько дней вперед строится сетка
+CALENDAR_DAYS = 14
+WEEK_DAYS = 7
+
+CALENDAR_CACHE_PREFIX = 'delivery_slots:'
+CALENDAR_CACHE_TTL = 60 * 60 * 24
+
+def _mode(mode):
+    # Все, что не доставка, - часы работы магазина (как в get_work_hours)
+    return 'delivery' if mode == 'delivery' else 'pickup'
+
+
+def _tz(settings):
+    try:
+        return pytz.timezone(settings.site_time_zone)
+    except:
+        return timezone.get_default_timezone()
+
+
+def _build_calendar(settings, tz, first_day, mode):
+    """{'2026-10-18': [(начало в unix-секундах, подпись), ...], ...}"""
+    calendar = {}
+    for offset in range(CALENDAR_DAYS):
+        day = first_day + datetime.timedelta(days=offset)
+        calendar[day.isoformat()] = [
+            (int(start.timestamp()), label) for start, label in build_day_slots(day, settings, tz, mode)
+        ]
+    return calendar
+
+
+def get_calendar(mode='delivery'):
+    """Сетка интервалов с сегодняшнего дня (время магазина). Возвращает (сетка, настройки, часовой пояс)."""
+    mode = _mode(mode)
+    settings = SiteSettings.get_solo()
+    tz = _tz(settings)
+    today = timezone.now().astimezone(tz).date()
+
+    key = f"{CALENDAR_CACHE_PREFIX}{settings_cache.current_version()}:{mode}:{today.isoformat()}"
+    calendar = cache.get(key)
+    if calendar is None:
+        calendar = _build_calendar(settings, tz, today, mode)
+        cache.set(key, calendar, CALENDAR_CACHE_TTL)
+    return calendar, settings, tz
+
+
+def _available(day_slots, cutoff=None):
+    return [
+        {'value': label, 'label': label}
+        for start, label in day_slots
+        if cutoff is None or start >= cutoff
+    ]
+
+
+def _parse_date(date_str):
+    try:
+        return datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def _slots_for_day(day, calendar, settings, tz, mode, now):
+    today = now.date()
+    if day < today:
+        return []
+
+    day_slots = calendar.get(day.isoformat())
+    if day_slots is None:
+        # Дальше сетки - считаем на месте
+        day_slots = [(int(start.timestamp()), label) for start, label in build_day_slots(day, settings, tz, mode)]
+
+    cutoff = None
+    if day == today:
+        cutoff = (now + datetime.timedelta(minutes=settings.processing_time)).timestamp()
+    return _available(day_slots, cutoff)
+
+
+def slots_for_date(date_str, mode='delivery'):
+    """Свободные интервалы на дату 'ГГГГ-ММ-ДД': [{'value', 'label'}, ...]."""
+    day = _parse_date(date_str)
+    if day is None:
+        return []
+    mode = _mode(mode)
+    calendar, settings, tz = get_calendar(mode)
+    return _slots_for_day(day, calendar, settings, tz, mode, timezone.now().astimezone(tz))
+
+
+def week_slots(start_str=None, mode='delivery'):
+    """Интервалы на неделю начиная с даты (по умолчанию с сегодня): [{'date', 'slots'}, ...]."""
+    mode = _mode(mode)
+    calendar, settings, tz = get_calendar(mode)
+    now = timezone.now().astimezone(tz)
+    start = _parse_date(start_str) if start_str else None
+    start = max(start or now.date(), now.date())
+
+    days = []
+    for offset in range(WEEK_DAYS):
+        day = start + datetime.timedelta(days=offset)
+        days.append({'date': day.isoformat(), 'slots': _slots_for_day(day, calendar, settings, tz, mode, now)})
+    return days
@@ -0,0 +1,175 @@
+# orders/snapshot.py
+
+"""
+Снимок заказа для писем.
+
+Заказ, открытка, промокод, позиции и товары загружаются двумя запросами
+на любую пачку заказов (select_related + Prefetch). Дальше шаблоны работают
+с простыми неизменяемыми объектами: ни одного запроса во время рендеринга,
+один снимок идет и в письмо клиенту, и в письмо админам.
+Даты переводятся во время магазина заранее, активировать часовой пояс не нужно.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+
+import pytz
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import Order, OrderItem
+
+
+@dataclass(frozen=True)
+class ItemSnapshot:
+    name: str
+    sku: str
+    image_url: str
+    price: object
+    quantity: int
+    cost: object
+
+
+@dataclass(frozen=True)
+class PostcardSnapshot:
+    title: str
+    image_url: str
+
+
+@dataclass(frozen=True)
+class SiteSnapshot:
+    shop_name: str
+    contact_phone: str
+    pickup_address: str
+    processing_time: int
+    site_time_zone: str
+    admin_emails: tuple
+
+
+@dataclass(frozen=True)
+class OrderSnapshot:
+    id: int
+    created: datetime
+    status: str
+    status_display: str
+    paid: bool
+    is_one_click: bool
+    first_name: str
+    last_name: str
+    email: str
+    phone: str
+    recipient_name: str
+    recipient_phone: str
+    address: str
+    city: str
+    delivery_option: str
+    delivery_date: object
+    delivery_time: str
+    delivery_time_display: str
+    delivery_cost: object
+    discount: int
+    promo_code: str
+    postcard: PostcardSnapshot
+    postcard_final_price: object
+    postcard_text: str
+    custom_postcard_image_url: str
+    items: tuple
+    items_total: object
+    discount_amount: object
+    grand_total: object
+
+    @property
+    def has_customer_email(self):
+        return bool(self.email) and 'no-email' not in self.email
+
+
+def _url(file_field):
+    try:
+        return file_field.url if file_field else ''
+    except ValueError:
+        # Файл не привязан к полю
+        return ''
+
+
+def get_admin_emails(site_settings):
+    raw_emails = (site_settings.admin_notification_emails or '').replace(';', ',')
+    return [email.strip() for email in raw_emails.split(',') if email.strip() and '@' in email]
+
+
+def site_snapshot(site_settings):
+    return SiteSnapshot(
+        shop_name=site_settings.shop_name,
+        contact_phone=site_settings.contact_phone,
+        pickup_address=site_settings.pickup_address,
+        processing_time=site_settings.processing_time,
+        site_time_zone=site_settings.site_time_zone,
+        admin_emails=tuple(get_admin_emails(site_settings)),
+    )
+
+
+def _local(value, tz):
+    """Время магазина без часового пояса: шаблон покажет его как есть."""
+    if value is None:
+        return None
+    return timezone.localtime(value, tz).replace(tzinfo=None)
+
+
+def build(order, tz):
+    postcard = None
+    if order.postcard:
+        postcard = PostcardSnapshot(title=order.postcard.title, image_url=_url(order.postcard.image))
+
+    return OrderSnapshot(
+        id=order.id,
+        created=_local(order.created, tz),
+        status=order.status,
+        status_display=order.get_status_display(),
+        paid=order.paid,
+        is_one_click=order.is_one_click,
+        first_name=order.first_name,
+        last_name=order.last_name,
+        email=order.email,
+        phone=order.phone,
+        recipient_name=order.recipient_name,
+        recipient_phone=order.recipient_phone,
+        address=order.address,
+        city=order.city,
+        delivery_option=order.delivery_option,
+        delivery_date=order.delivery_date,
+        delivery_time=order.delivery_time,
+        delivery_time_display=order.get_delivery_time_display(),
+        delivery_cost=order.delivery_cost,
+        discount=order.discount,
+        promo_code=order.promo_code.code if order.promo_code else '',
+        postcard=postcard,
+        postcard_final_price=order.postcard_final_price,
+        postcard_text=order.postcard_text,
+        custom_postcard_image_url=_url(order.custom_postcard_image),
+        items=tuple(
+            ItemSnapshot(
+                name=item.product.name,
+                sku=item.product.sku or '',
+                image_url=_url(item.product.image),
+                price=item.price,
+                quantity=item.quantity,
+                cost=item.get_cost(),
+            )
+            for item in order.items.all()
+        ),
+        items_total=order.items_total,
+        discount_amount=order.discount_amount,
+        grand_total=order.grand_total,
+    )
+
+
+def load_many(order_ids, site):
+    """{id: OrderSnapshot} для пачки заказов (два запроса на всю пачку)."""
+    try:
+        tz = pytz.timezone(site.site_time_zone)
+    except pytz.UnknownTimeZoneError:
+        tz = timezone.get_default_timezone()
+
+    orders = Order.objects.filter(id__in=set(order_ids)).select_related('postcard', 'promo_code').prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('product').order_by('id'))
+    )
+    return {order.id: build(order, tz) for order in orders}
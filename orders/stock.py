@@ -0,0 +1,102 @@
+# orders/stock.py
+
+"""
+Списание и возврат остатков товаров без гонок.
+
+Раньше остаток проверялся в Python, уменьшался в объекте и сохранялся
+(bulk_update / save). Два одновременных покупателя могли купить последний букет.
+Теперь строки товаров блокируются в порядке id (без взаимных блокировок),
+и остатки меняются одним условным UPDATE на весь заказ:
+    UPDATE shop_product SET stock = CASE id WHEN .. THEN stock - n .. END
+    WHERE (id = .. AND stock >= n) OR ...
+"""
+
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, When
+
+from shop.models import Product
+from . import holds
+
+
+class InsufficientStock(Exception):
+    """Товара не хватает на складе."""
+
+    def __init__(self, product, requested, available):
+        self.product = product
+        self.requested = requested
+        self.available = available
+        super().__init__(self.message)
+
+    @property
+    def message(self):
+        name = self.product.name if self.product else 'Товар'
+        return f"Извините, товара '{name}' на складе осталось только {self.available} шт."
+
+
+def _normalize(quantities):
+    """{товар или id: количество} -> {id: количество}, без нулей."""
+    result = {}
+    for key, quantity in quantities.items():
+        product_id = getattr(key, 'id', key)
+        if quantity > 0:
+            result[int(product_id)] = result.get(int(product_id), 0) + quantity
+    return result
+
+
+def _lock(product_ids):
+    """Блокирует строки товаров в порядке id и возвращает {id: товар}."""
+    products = Product.objects.select_for_update().filter(id__in=product_ids).order_by('id')
+    return {product.id: product for product in products}
+
+
+def reserve(quantities, owner=None):
+    """
+    Списывает остатки для заказа: {товар или id: количество}.
+    Если хоть одного товара не хватает, ничего не списывается и
+    выбрасывается InsufficientStock. Чужие брони (orders/holds.py) считаются занятыми.
+    """
+    quantities = _normalize(quantities)
+    if not quantities:
+        return
+
+    with transaction.atomic():
+        products = _lock(sorted(quantities))
+        held = holds.held_by_others(list(quantities), owner)
+        for product_id in sorted(quantities):
+            product = products.get(product_id)
+            available = product.stock - held.get(product_id, 0) if product else 0
+            if available < quantities[product_id]:
+                raise InsufficientStock(product, quantities[product_id], available)
+
+        condition = Q()
+        for product_id, quantity in quantities.items():
+            condition |= Q(id=product_id, stock__gte=quantity)
+        updated = Product.objects.filter(condition).update(stock=Case(
+            *[When(id=product_id, then=F('stock') - quantity) for product_id, quantity in quantities.items()],
+            default=F('stock'),
+            output_field=PositiveIntegerField(),
+        ))
+
+        if updated != len(quantities):
+            # Без блокировок строк (SQLite) остаток мог уйти между проверкой и UPDATE.
+            # Выход из atomic с исключением откатит частичное списание.
+            short = Product.objects.filter(id__in=quantities).values_list('id', 'stock')
+            for product_id, stock in short:
+                if stock < quantities[product_id]:
+                    raise InsufficientStock(products.get(product_id), quantities[product_id], stock)
+            raise InsufficientStock(None, 0, 0)
+
+
+def release(quantities):
+    """Возвращает остатки на склад (отмена заказа): {товар или id: количество}."""
+    quantities = _normalize(quantities)
+    if not quantities:
+        return
+
+    with transaction.atomic():
+        _lock(sorted(quantities))
+        Product.objects.filter(id__in=quantities).update(stock=Case(
+            *[When(id=product_id, then=F('stock') + quantity) for product_id, quantity in quantities.items()],
+            default=F('stock'),
+            output_field=PositiveIntegerField(),
+        ))
@@ -1,3 +1,375 @@
-from django.test import TestCase
+import datetime
+import smtplib
+import tempfile
+from decimal import Decimal
 
-# Create your tests here.
+import pytz
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from django_q.models import Schedule
+
+from shop import settings_cache
+from shop.models import Postcard, Product, SiteSettings
+from . import holds, mailer, outbox, slots, snapshot, stock, utils
+from .models import Order, OrderEvent, OrderItem, StockHold
+
+# Тесты не трогают общий кэш проекта (файлы на диске или Redis) и его медиа:
+# SiteSettings.save() собирает тему в MEDIA_ROOT и после коммита удаляет старые файлы
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+TEST_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def fresh_site_settings():
+    """Настройки живут в памяти процесса дольше теста - перечитываем строку текущего теста."""
+    settings_cache.invalidate()
+    return SiteSettings.get_solo()
+
+
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=TEST_MEDIA_ROOT)
+class OrderCreateQueryCountTest(TestCase):
+    """Число запросов при оформлении заказа не зависит от размера корзины."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+        self.products = [
+            Product.objects.create(name=f'Букет {i}', slug=f'buket-{i}', price=Decimal('1500.00'), stock=10)
+            for i in range(6)
+        ]
+        # Настройки сайта загружаются один раз на процесс - прогреваем заранее
+        fresh_site_settings()
+        self.client.force_login(self.user)
+
+    def checkout(self, products):
+        session = self.client.session
+        session[settings.CART_SESSION_ID] = {
+            str(product.id): {'quantity': 2, 'price': str(product.price), 'postcard_text': ''}
+            for product in products
+        }
+        session.save()
+
+        data = {
+            'delivery_option': 'pickup',
+            'first_name': 'Анна',
+            'phone': '+79990000000',
+            'time_mode': 'asap',
+            'postcard': '',
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('orders:order_create'), data)
+        self.assertEqual(response.status_code, 302)
+        return len(queries)
+
+    def test_query_count_is_constant(self):
+        one_item = self.checkout(self.products[:1])
+        five_items = self.checkout(self.products[1:])
+
+        self.assertEqual(one_item, five_items)
+        self.assertEqual(OrderItem.objects.count(), 6)
+        for product in Product.objects.all():
+            self.assertEqual(product.stock, 8)
+
+
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=TEST_MEDIA_ROOT)
+class StockTest(TestCase):
+    """Списание и возврат остатков одним UPDATE по реальным строкам."""
+
+    def setUp(self):
+        self.roses = Product.objects.create(name='Букет роз', slug='buket-roz', price=Decimal('2500.00'), stock=5)
+        self.tulips = Product.objects.create(name='Тюльпаны', slug='tyulpany', price=Decimal('1200.00'), stock=2)
+
+    def stocks(self):
+        return dict(Product.objects.values_list('id', 'stock'))
+
+    def test_reserve_and_release(self):
+        stock.reserve({self.roses: 3, self.tulips.id: 2})
+        self.assertEqual(self.stocks(), {self.roses.id: 2, self.tulips.id: 0})
+
+        stock.release({self.roses: 3, self.tulips: 1})
+        self.assertEqual(self.stocks(), {self.roses.id: 5, self.tulips.id: 1})
+
+    def test_reserve_is_all_or_nothing(self):
+        with self.assertRaises(stock.InsufficientStock):
+            stock.reserve({self.roses: 1, self.tulips: 3})
+        self.assertEqual(self.stocks(), {self.roses.id: 5, self.tulips.id: 2})
+
+
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=TEST_MEDIA_ROOT)
+class OrderNumberTest(TestCase):
+    """Занятый номер не перезаписывает чужой заказ, счетчик догоняет MAX(id)."""
+
+    def make_order(self, **kwargs):
+        return Order.objects.create(first_name='Анна', phone='+79990000000', **kwargs)
+
+    def test_taken_number_is_skipped(self):
+        first = self.make_order()
+        # Заказ с явным id, счетчик о нем не знает
+        taken = Order(id=first.id + 1, first_name='Борис', phone='+79991111111')
+        super(Order, taken).save(force_insert=True)
+
+        order = self.make_order()
+
+        self.assertEqual(order.id, first.id + 2)
+        self.assertEqual(Order.objects.get(pk=taken.id).first_name, 'Борис')
+        self.assertEqual(self.make_order().id, first.id + 3)
+
+
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=TEST_MEDIA_ROOT)
+class StockHoldScheduleTest(TestCase):
+    """Расписание снятия броней есть, только пока брони включены."""
+
+    def test_schedule_follows_setting(self):
+        with self.settings(STOCK_HOLDS_ENABLED=True):
+            self.assertTrue(holds.sync_schedule())
+            self.assertTrue(holds.sync_schedule())
+        self.assertEqual(Schedule.objects.filter(name=holds.SCHEDULE_NAME).count(), 1)
+
+        with self.settings(STOCK_HOLDS_ENABLED=False):
+            self.assertFalse(holds.sync_schedule())
+        self.assertFalse(Schedule.objects.filter(name=holds.SCHEDULE_NAME).exists())
+
+    @override_settings(STOCK_HOLDS_ENABLED=False)
+    def test_task_does_nothing_when_disabled(self):
+        product = Product.objects.create(name='Букет роз', slug='buket-roz', price=Decimal('2500.00'), stock=5)
+        StockHold.objects.create(product=product, owner='user:1', quantity=1,
+                                 expires_at=timezone.now() - datetime.timedelta(minutes=1))
+
+        self.assertEqual(holds.release_expired_holds(), 0)
+        self.assertEqual(StockHold.objects.count(), 1)
+
+
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=TEST_MEDIA_ROOT)
+class OrderChangelistQueryCountTest(TestCase):
+    """Список заказов в админке загружается за постоянное число запросов."""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.postcard = Postcard.objects.create(title='С днем рождения', image='postcards/card.jpg', price=Decimal('150.00'))
+        self.product = Product.objects.create(name='Букет роз', slug='buket-roz', price=Decimal('2500.00'), stock=10)
+        fresh_site_settings()
+        self.client.force_login(self.admin)
+
+    def create_orders(self, count):
+        for i in range(count):
+            order = Order.objects.create(
+                user=self.admin, first_name='Анна', last_name='Иванова', email='anna@example.com',
+                phone='+79990000000', address='ул. Ленина, 1', city='Москва', postcard=self.postcard,
+            )
+            OrderItem.objects.create(order=order, product=self.product, price=self.product.price, quantity=2)
+            order.recalculate_totals()
+
+    def changelist_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:orders_order_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_is_constant(self):
+        self.create_orders(2)
+        # Первый запрос прогревает кэши процесса (content types, права, сессия)
+        self.changelist_queries()
+        few = self.changelist_queries()
+        self.create_orders(10)
+        many = self.changelist_queries()
+
+        self.assertEqual(few, many)
+
+    def test_search_by_product_name(self):
+        self.create_orders(1)
+        response = self.client.get(reverse('admin:orders_order_changelist'), {'q': 'роз'})
+        self.assertContains(response, 'Анна')
+
+
+class RecordingBackend(EmailBackend):
+    """locmem-бэкенд, который считает открытые соединения и не принимает адреса из REFUSED."""
+    opened = 0
+    REFUSED = {'broken@example.com'}
+
+    def open(self):
+        RecordingBackend.opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        for message in messages:
+            refused = self.REFUSED.intersection(message.recipients())
+            if refused:
+                raise smtplib.SMTPRecipientsRefused({address: (550, b'No such user') for address in refused})
+        return super().send_messages(messages)
+
+
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=TEST_MEDIA_ROOT, EMAIL_BACKEND='orders.tests.RecordingBackend', EMAIL_HOST_USER='shop@example.com')
+class MailerTest(TestCase):
+
+    def setUp(self):
+        mailer.close()
+        RecordingBackend.opened = 0
+
+    def tearDown(self):
+        mailer.close()
+
+    def test_batch_uses_one_connection(self):
+        messages = [mailer.build_message(f'Заказ #{i}', '<p>Спасибо</p>', [f'client{i}@example.com']) for i in range(3)]
+
+        self.assertEqual(mailer.send_batch(messages), 3)
+        self.assertEqual(mailer.send_batch([mailer.build_message('Еще', '<p></p>', ['a@example.com'])]), 1)
+        self.assertEqual(RecordingBackend.opened, 1)
+        self.assertEqual(len(mail.outbox), 4)
+
+    def test_failed_recipient_is_retried_separately(self):
+        message = mailer.build_message('Новый заказ', '<p>Заказ</p>', ['admin@example.com', 'broken@example.com'])
+
+        self.assertEqual(mailer.send_batch([message]), 1)
+        self.assertEqual([m.to for m in mail.outbox], [['admin@example.com']])
+        retry = Schedule.objects.get(func='orders.mailer.retry_recipient_task')
+        self.assertIn('broken@example.com', retry.args)
+
+
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=TEST_MEDIA_ROOT, EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OutboxTest(TestCase):
+
+    def setUp(self):
+        mailer.close()
+        self.order = Order.objects.create(
+            first_name='Анна', last_name='Иванова', email='anna@example.com',
+            phone='+79990000000', address='ул. Ленина, 1', city='Москва',
+        )
+
+    def tearDown(self):
+        mailer.close()
+
+    def test_dispatch_is_queued_only_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            outbox.record(self.order, OrderEvent.CREATED, base_url='http://testserver')
+            self.assertEqual(callbacks, [])
+        self.assertEqual(len(callbacks), 1)
+
+    def test_events_are_processed_once(self):
+        outbox.record_many([self.order, self.order], OrderEvent.STATUS_CHANGED)
+
+        self.assertEqual(outbox.dispatch(), 2)
+        self.assertEqual(outbox.dispatch(), 0)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertFalse(OrderEvent.objects.filter(processed_at__isnull=True).exists())
+
+
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=TEST_MEDIA_ROOT, EMAIL_BACKEND='orders.tests.RecordingBackend', EMAIL_HOST_USER='shop@example.com')
+class OutboxFailureTest(TestCase):
+    """Неудачная отправка не закрывает событие, а ушедшие письма не повторяются."""
+
+    def setUp(self):
+        mailer.close()
+        site_settings = fresh_site_settings()
+        site_settings.admin_notification_emails = 'admin@example.com, broken@example.com'
+        with self.captureOnCommitCallbacks(execute=True):
+            site_settings.save()
+        self.order = Order.objects.create(
+            first_name='Анна', last_name='Иванова', email='anna@example.com',
+            phone='+79990000000', address='ул. Ленина, 1', city='Москва',
+        )
+
+    def tearDown(self):
+        mailer.close()
+        settings_cache.invalidate()
+
+    def test_failed_event_is_retried_without_resending(self):
+        event = outbox.record(self.order, OrderEvent.CREATED, base_url='http://testserver')
+
+        self.assertEqual(outbox.dispatch(), 1)
+        event.refresh_from_db()
+        self.assertIsNone(event.processed_at)
+        self.assertEqual(event.attempts, 1)
+        self.assertEqual([key.split()[0] for key in event.sent_to], ['anna@example.com', 'admin@example.com'])
+        self.assertIn('broken@example.com', event.last_error)
+        self.assertEqual([m.to for m in mail.outbox], [['anna@example.com'], ['admin@example.com']])
+
+        # До истечения паузы событие не берется повторно
+        self.assertEqual(outbox.dispatch(), 0)
+
+        OrderEvent.objects.filter(id=event.id).update(claimed_until=None)
+        with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+            mailer.close()
+            self.assertEqual(outbox.dispatch(), 1)
+        event.refresh_from_db()
+        self.assertIsNotNone(event.processed_at)
+        self.assertEqual(len(event.sent_to), 3)
+        # Письмо админам ушло только на адрес, который в прошлый раз отказал
+        self.assertEqual([m.to for m in mail.outbox], [['anna@example.com'], ['admin@example.com'], ['broken@example.com']])
+
+
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=TEST_MEDIA_ROOT)
+class OrderSnapshotTest(TestCase):
+    """Снимок заказов для писем загружается пачкой, рендеринг писем не делает запросов."""
+
+    def setUp(self):
+        site_settings = fresh_site_settings()
+        site_settings.admin_notification_emails = 'admin@example.com'
+        self.site = snapshot.site_snapshot(site_settings)
+        postcard = Postcard.objects.create(title='С днем рождения', image='postcards/card.jpg', price=Decimal('150.00'))
+        product = Product.objects.create(name='Букет роз', slug='buket-roz', price=Decimal('2500.00'), stock=10)
+
+        self.order_ids = []
+        for i in range(3):
+            order = Order.objects.create(
+                first_name='Анна', last_name='Иванова', email='anna@example.com',
+                phone='+79990000000', address='ул. Ленина, 1', city='Москва', postcard=postcard,
+            )
+            OrderItem.objects.create(order=order, product=product, price=product.price, quantity=2)
+            order.recalculate_totals()
+            self.order_ids.append(order.id)
+
+    def test_batch_is_loaded_in_two_queries(self):
+        with self.assertNumQueries(2):
+            snapshots = snapshot.load_many(self.order_ids, self.site)
+
+        order = snapshots[self.order_ids[0]]
+        self.assertEqual(order.items[0].name, 'Букет роз')
+        self.assertEqual(order.items_total, Decimal('5000.00'))
+
+        with self.assertNumQueries(0):
+            messages = utils.order_creation_messages(order, self.site, 'http://testserver')
+        self.assertEqual([m.to for m in messages], [['anna@example.com'], ['admin@example.com']])
+        self.assertIn('5150.00', messages[1].subject)
+
+
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=TEST_MEDIA_ROOT)
+class DeliverySlotsTest(TestCase):
+
+    def setUp(self):
+        fresh_site_settings()
+
+    def tearDown(self):
+        settings_cache.invalidate()
+
+    def test_week_endpoint(self):
+        response = self.client.get(reverse('orders:api_get_week_slots'), {'type': 'delivery'})
+        days = response.json()['days']
+
+        self.assertEqual(len(days), slots.WEEK_DAYS)
+        self.assertTrue(all(day['slots'] for day in days[1:]))
+        self.assertEqual(days[1]['slots'], slots.slots_for_date(days[1]['date']))
+
+    def test_calendar_is_cached_until_settings_change(self):
+        first, _, _ = slots.get_calendar('delivery')
+        self.assertEqual(slots.get_calendar('delivery')[0], first)
+
+        site_settings = SiteSettings.get_solo()
+        site_settings.interval_step = site_settings.interval_step + 60
+        with self.captureOnCommitCallbacks(execute=True):
+            site_settings.save()
+
+        self.assertNotEqual(slots.get_calendar('delivery')[0], first)
+
+    def test_unsaved_settings_with_string_times(self):
+        day_slots = utils.build_day_slots(datetime.date(2026, 10, 19), SiteSettings(), pytz.timezone('Europe/Moscow'))
+
+        self.assertEqual(day_slots[0][1], '09:00 - 11:00')
+
+    def test_past_date_has_no_slots(self):
+        self.assertEqual(slots.slots_for_date('2000-01-01'), [])
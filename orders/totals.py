@@ -0,0 +1,32 @@
+# orders/totals.py
+
+"""
+Пересчет сохраненных итогов заказов (items_total, discount_amount, grand_total)
+тремя UPDATE на всю таблицу. Миграция 0009 содержит свою копию этого расчета.
+"""
+
+from decimal import Decimal
+
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+
+MONEY = DecimalField(max_digits=10, decimal_places=2)
+
+
+def backfill(order_model, item_model, queryset=None):
+    """Пересчитывает итоги заказов из queryset (по умолчанию всех). Возвращает количество заказов."""
+    orders = queryset if queryset is not None else order_model.objects.all()
+
+    items_total = item_model.objects.filter(order=OuterRef('pk')).values('order').annotate(
+        total=Sum(ExpressionWrapper(F('price') * F('quantity'), output_field=MONEY))
+    ).values('total')
+
+    count = orders.update(items_total=Coalesce(Subquery(items_total, output_field=MONEY), Value(Decimal('0.00'))))
+    orders.update(discount_amount=Round(
+        ExpressionWrapper(F('items_total') * F('discount') / Value(Decimal(100)), output_field=MONEY), 2
+    ))
+    orders.update(grand_total=ExpressionWrapper(
+        F('items_total') - F('discount_amount') + F('delivery_cost') + F('postcard_final_price'),
+        output_field=MONEY,
+    ))
+    return count
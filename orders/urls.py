@@ -9,6 +9,7 @@ urlpatterns = [
     path('created/', views.order_created, name='order_created'),
 
     path('api/get-slots/', views.get_time_slots, name='api_get_slots'),
+    path('api/get-week-slots/', views.get_week_slots, name='api_get_week_slots'),
     path('api/check-asap/', views.check_asap, name='api_check_asap'),
 
     # === НОВЫЙ URL ДЛЯ 1 КЛИКА ===
@@ -2,48 +2,44 @@
 
 import pytz
 from django.utils import timezone
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
+from django.utils.dateparse import parse_time
+from django.template.loader import get_template
 from django.urls import reverse
 from django.conf import settings
 from shop.models import SiteSettings
-from .models import Order
+from . import mailer, snapshot
 import datetime
 from decimal import Decimal
 
 
 # =====генератор интервалов=================================================================================
 
+def _as_time(value):
+    # У несохраненных настроек в TimeField лежит строка по умолчанию ("09:00")
+    return parse_time(value) if isinstance(value, str) else value
+
+
 def get_work_hours(date_obj, settings, mode='delivery'):
     weekday = date_obj.weekday()
 
     if mode == 'delivery':
         if weekday < 5:
-            return settings.delivery_weekdays_open, settings.delivery_weekdays_close
+            hours = settings.delivery_weekdays_open, settings.delivery_weekdays_close
         else:
-            return settings.delivery_weekend_open, settings.delivery_weekend_close
+            hours = settings.delivery_weekend_open, settings.delivery_weekend_close
     else:
         if weekday < 5:
-            return settings.work_weekdays_open, settings.work_weekdays_close
+            hours = settings.work_weekdays_open, settings.work_weekdays_close
         else:
-            return settings.work_weekend_open, settings.work_weekend_close
-
-
-def generate_time_slots(date_str, mode='delivery'):
-    settings = SiteSettings.get_solo()
-    tz = pytz.timezone(settings.site_time_zone)
+            hours = settings.work_weekend_open, settings.work_weekend_close
+    return tuple(_as_time(value) for value in hours)
 
-    try:
-        target_date = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
-    except ValueError:
-        return []
-
-    now_in_shop = timezone.now().astimezone(tz)
-    today_date = now_in_shop.date()
-
-    if target_date < today_date:
-        return []
 
+def build_day_slots(target_date, settings, tz, mode='delivery'):
+    """
+    Сетка интервалов на день без учета текущего времени: [(начало, подпись), ...].
+    Текущее время (сейчас + время на сборку) применяется отдельно - см. orders/slots.py.
+    """
     start_time, end_time = get_work_hours(target_date, settings, mode)
 
     start_dt = tz.localize(datetime.datetime.combine(target_date, start_time))
@@ -55,7 +51,6 @@ def generate_time_slots(date_str, mode='delivery'):
     slots = []
     current_dt = start_dt
     step = datetime.timedelta(minutes=settings.interval_step)
-    processing_delta = datetime.timedelta(minutes=settings.processing_time)
 
     while current_dt < end_dt:
         slot_end = current_dt + step
@@ -66,16 +61,8 @@ def generate_time_slots(date_str, mode='delivery'):
         if (slot_end - current_dt).total_seconds() < 1800:
             break
 
-        is_available = True
-        if target_date == today_date:
-            cutoff_time = now_in_shop + processing_delta
-            if current_dt < cutoff_time:
-                is_available = False
-
-        if is_available:
-            label = f"{current_dt.strftime('%H:%M')} - {slot_end.strftime('%H:%M')}"
-            value = label
-            slots.append({'value': value, 'label': label})
+        label = f"{current_dt.strftime('%H:%M')} - {slot_end.strftime('%H:%M')}"
+        slots.append((current_dt, label))
 
         current_dt = slot_end
 
@@ -155,153 +142,158 @@ def get_order_summary(order):
     return summary
 
 
-def send_order_creation_emails_task(order_id, base_url):
-    print(f"--- НАЧАЛО ОТПРАВКИ (Заказ #{order_id}) ---")
-    try:
-        order = Order.objects.get(id=order_id)
-    except Order.DoesNotExist:
-        print(f"Ошибка: Заказ {order_id} не найден.")
-        return
+# === Письма (собираются пачкой и отправляются одним соединением, см. orders/mailer.py) ===
+# Шаблоны получают снимок заказа (orders/snapshot.py), а не модель: рендеринг без запросов.
 
-    site_settings = SiteSettings.get_solo()
-    activate_site_timezone(site_settings)
+# Скомпилированные шаблоны писем (на процесс воркера)
+_email_templates = {}
 
-    try:
-        # ИСПРАВЛЕНО: Добавляем форматирование времени доставки
-        order.delivery_time_display = format_delivery_time(order)
 
-        context = {
-            'order': order,
-            'site_settings': site_settings,
-            'base_url': base_url
-        }
+def render_email(template_name, context):
+    template = _email_templates.get(template_name)
+    if template is None:
+        template = _email_templates[template_name] = get_template(template_name)
+    return template.render(context)
 
-        # 1. КЛИЕНТУ
-        if order.email and 'no-email' not in order.email:
-            try:
-                subject_customer = f'Подтверждение заказа #{order.id} - {site_settings.shop_name}'
-                html_content_customer = render_to_string('orders/email/customer_confirmation.html', context)
-                msg_customer = EmailMultiAlternatives(subject_customer, '', settings.EMAIL_HOST_USER, [order.email])
-                msg_customer.attach_alternative(html_content_customer, "text/html")
-                msg_customer.send()
-                print(f"✅ Клиенту ({order.email}) отправлено.")
-            except Exception as e:
-                print(f"❌ Ошибка отправки клиенту: {e}")
-
-        # 2. АДМИНАМ
-        raw_emails = site_settings.admin_notification_emails.replace(';', ',')
-        admin_emails = [email.strip() for email in raw_emails.split(',') if email.strip() and '@' in email]
-
-        print(f"Email админов из настроек: {admin_emails}")
-
-        if admin_emails:
-            try:
-                admin_order_url = f"{base_url}{reverse('admin:orders_order_change', args=[order.id])}"
-                context_admin = context.copy()
-                context_admin['admin_order_url'] = admin_order_url
-
-                # ИСПРАВЛЕНО: В заголовке теперь правильная общая стоимость
-                subject_admin = f'Новый заказ #{order.id} ({order.get_total_cost()} руб.)'
-                html_content_admin = render_to_string('orders/email/admin_notification.html', context_admin)
-
-                msg_admin = EmailMultiAlternatives(subject_admin, '', settings.EMAIL_HOST_USER, admin_emails)
-                msg_admin.attach_alternative(html_content_admin, "text/html")
-                msg_admin.send()
-                print(f"✅ Админам отправлено.")
-            except Exception as e:
-                print(f"❌ Ошибка отправки админу: {e}")
-        else:
-            print("⚠️ Список админов пуст! Проверьте 'Настройки сайта' -> 'Email для уведомлений'")
 
+def order_creation_messages(order, site, base_url):
+    """Письма о новом заказе: клиенту и админам (один снимок заказа на оба письма)."""
+    messages = []
+    context = {
+        'order': order,
+        'site_settings': site,
+        'base_url': base_url
+    }
+
+    # 1. КЛИЕНТУ
+    if order.has_customer_email:
+        subject_customer = f'Подтверждение заказа #{order.id} - {site.shop_name}'
+        html_content_customer = render_email('orders/email/customer_confirmation.html', context)
+        messages.append(mailer.build_message(subject_customer, html_content_customer, [order.email]))
+
+    # 2. АДМИНАМ
+    admin_emails = list(site.admin_emails)
+    print(f"Email админов из настроек: {admin_emails}")
+
+    if admin_emails:
+        admin_order_url = f"{base_url}{reverse('admin:orders_order_change', args=[order.id])}"
+        context_admin = context.copy()
+        context_admin['admin_order_url'] = admin_order_url
+
+        # Общая стоимость - из снимка, без запросов к позициям
+        subject_admin = f'Новый заказ #{order.id} ({order.grand_total} руб.)'
+        html_content_admin = render_email('orders/email/admin_notification.html', context_admin)
+        messages.append(mailer.build_message(subject_admin, html_content_admin, admin_emails))
+    else:
+        print("⚠️ Список админов пуст! Проверьте 'Настройки сайта' -> 'Email для уведомлений'")
+
+    return messages
+
+
+def cancellation_messages(order, site, base_url):
+    admin_emails = list(site.admin_emails)
+    if not admin_emails:
+        print("⚠️ Нет email админов для уведомления об отмене.")
+        return []
+
+    admin_order_url = f"{base_url}{reverse('admin:orders_order_change', args=[order.id])}"
+    subject = f'ОТМЕНА: Заказ #{order.id} на сайте {site.shop_name}'
+
+    context = {
+        'order': order,
+        'admin_order_url': admin_order_url,
+        'site_settings': site,
+        'base_url': base_url
+    }
+
+    html_message = render_email('orders/email/admin_cancellation_notification.html', context)
+    return [mailer.build_message(subject, html_message, admin_emails)]
+
+
+def status_update_messages(order, site):
+    if not order.has_customer_email:
+        return []
+    subject = f'Статус заказа #{order.id} изменен - {site.shop_name}'
+    context = {'order': order, 'site_settings': site}
+    html_content = render_email('orders/email/status_update.html', context)
+    return [mailer.build_message(subject, html_content, [order.email])]
+
+
+def order_confirmation_messages(order, site):
+    if not order.has_customer_email:
+        return []
+    subject = f'Подтверждение заказа #{order.id} - {site.shop_name}'
+    context = {'order': order, 'site_settings': site}
+    html_content = render_email('orders/email/customer_confirmation.html', context)
+    return [mailer.build_message(subject, html_content, [order.email])]
+
+
+def build_messages(jobs, site):
+    """
+    jobs - список (id заказа, функция писем, доп. аргументы).
+    Снимки всех заказов загружаются одной пачкой.
+    """
+    snapshots = snapshot.load_many([order_id for order_id, _build, _args in jobs], site)
+    messages = []
+    for order_id, build, args in jobs:
+        order = snapshots.get(order_id)
+        if order is None:
+            print(f"Ошибка: Заказ {order_id} не найден.")
+            continue
+        try:
+            messages.extend(build(order, site, *args))
+        except Exception as e:
+            print(f"❌ Ошибка подготовки письма по заказу #{order_id}: {e}")
+    return messages
+
+
+def _send_for_orders(order_ids, build, *args):
+    """Собирает письма по заказам и отправляет их одной пачкой."""
+    site = snapshot.site_snapshot(SiteSettings.get_solo())
+    messages = build_messages([(order_id, build, args) for order_id in order_ids], site)
+    sent = mailer.send_batch(messages)
+    print(f"✅ Отправлено писем: {sent} из {len(messages)}")
+    return sent
+
+
+# === Задачи django-q ===
+
+def send_order_creation_emails_task(order_id, base_url):
+    print(f"--- НАЧАЛО ОТПРАВКИ (Заказ #{order_id}) ---")
+    try:
+        _send_for_orders([order_id], order_creation_messages, base_url)
     except Exception as e:
         print(f"❌ Общая ошибка в задаче: {e}")
     finally:
-        timezone.deactivate()
         print("--- КОНЕЦ ---")
 
 
 def send_cancellation_email_task(order_id, base_url):
     try:
-        order = Order.objects.get(id=order_id)
-    except Order.DoesNotExist:
-        return
-
-    site_settings = SiteSettings.get_solo()
-    activate_site_timezone(site_settings)
-
-    try:
-        raw_emails = site_settings.admin_notification_emails.replace(';', ',')
-        admin_emails = [email.strip() for email in raw_emails.split(',') if email.strip() and '@' in email]
-
-        if admin_emails:
-            admin_order_url = f"{base_url}{reverse('admin:orders_order_change', args=[order.id])}"
-            subject = f'ОТМЕНА: Заказ #{order.id} на сайте {site_settings.shop_name}'
-
-            context = {
-                'order': order,
-                'admin_order_url': admin_order_url,
-                'site_settings': site_settings,
-                'base_url': base_url
-            }
-
-            html_message = render_to_string('orders/email/admin_cancellation_notification.html', context)
-
-            msg = EmailMultiAlternatives(subject, '', settings.EMAIL_HOST_USER, admin_emails)
-            msg.attach_alternative(html_message, "text/html")
-            msg.send()
-            print("✅ Письмо об отмене отправлено админу.")
-        else:
-            print("⚠️ Нет email админов для уведомления об отмене.")
-
+        _send_for_orders([order_id], cancellation_messages, base_url)
     except Exception as e:
         print(f"Ошибка при отправке отмены: {e}")
-    finally:
-        timezone.deactivate()
 
 
 def send_status_update_email_task(order_id):
-    try:
-        order = Order.objects.get(id=order_id)
-    except Order.DoesNotExist:
-        return
+    send_status_update_emails_task([order_id])
 
-    if not order.email or 'no-email' in order.email:
-        return
 
-    site_settings = SiteSettings.get_solo()
-    activate_site_timezone(site_settings)
+def send_order_confirmation_email_task(order_id):
+    send_order_confirmation_emails_task([order_id])
 
-    try:
-        subject = f'Статус заказа #{order.id} изменен - {site_settings.shop_name}'
-        context = {'order': order, 'site_settings': site_settings}
 
-        html_content = render_to_string('orders/email/status_update.html', context)
-        msg = EmailMultiAlternatives(subject, '', settings.EMAIL_HOST_USER, [order.email])
-        msg.attach_alternative(html_content, "text/html")
-        msg.send()
+def send_status_update_emails_task(order_ids):
+    """Уведомления о статусе для нескольких заказов одной пачкой (массовое действие в админке)."""
+    try:
+        _send_for_orders(order_ids, status_update_messages)
     except Exception as e:
         print(f"Ошибка при отправке статуса: {e}")
-    finally:
-        timezone.deactivate()
 
 
-def send_order_confirmation_email_task(order_id):
+def send_order_confirmation_emails_task(order_ids):
+    """Подтверждения для нескольких заказов одной пачкой (массовое действие в админке)."""
     try:
-        order = Order.objects.get(id=order_id)
-        if not order.email or 'no-email' in order.email:
-            return
-
-        site_settings = SiteSettings.get_solo()
-        activate_site_timezone(site_settings)
-
-        subject = f'Подтверждение заказа #{order.id} - {site_settings.shop_name}'
-        context = {'order': order, 'site_settings': site_settings}
-
-        html_content = render_to_string('orders/email/customer_confirmation.html', context)
-        msg = EmailMultiAlternatives(subject, '', settings.EMAIL_HOST_USER, [order.email])
-        msg.attach_alternative(html_content, "text/html")
-        msg.send()
+        _send_for_orders(order_ids, order_confirmation_messages)
     except Exception as e:
         print(f"Ошибка при повторной отправке: {e}")
-    finally:
-        timezone.deactivate()
\ No newline at end of file
@@ -4,17 +4,17 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.db import transaction
 from decimal import Decimal
-from django_q.tasks import async_task
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST, require_GET
 
-from .models import Order, OrderItem
+from .models import Order, OrderEvent, OrderItem
+from . import holds, outbox, slots, stock
 from .forms import OrderCreateForm, OneClickOrderForm
 from cart.cart import Cart
 from users.models import Profile
 from shop.models import SiteSettings, Product, Postcard
 from promo.models import PromoCode
-from .utils import generate_time_slots, is_shop_open_now
+from .utils import is_shop_open_now
 
 
 @transaction.atomic
@@ -26,39 +26,43 @@ def order_create(request):
 
     site_settings = SiteSettings.get_solo()
     profile, created = Profile.objects.get_or_create(user=request.user)
+    # Итоги корзины считаются один раз за запрос (cart/pricing.py)
+    totals = cart.get_totals()
 
     if request.method == 'POST':
         form = OrderCreateForm(request.POST, request.FILES)
         if form.is_valid():
-            # Проверка наличия товаров
-            for item in cart:
-                product = item['product']
-                if product.stock < item['quantity']:
-                    error_message = f"Извините, товара '{product.name}' на складе осталось только {product.stock} шт."
-                    form.add_error(None, error_message)
-                    postcards = Postcard.objects.filter(is_active=True).order_by('price', 'order')
-                    cart_total = cart.get_total_price_after_discount() if hasattr(cart,
-                                                                                  'get_total_price_after_discount') else cart.get_total_price()
-                    return render(request, 'orders/create.html', {
-                        'cart': cart,
-                        'form': form,
-                        'postcards': postcards,
-                        'delivery_cost_js': site_settings.delivery_cost,
-                        'cart_total_js': cart_total
-                    })
+            # Сверка с каталогом: цены, снятые с продажи товары, остатки.
+            # Корзина уже исправлена (новые цены), покупатель должен увидеть итог заново.
+            errors = [change.message for change in totals.changes]
+            if not errors:
+                # Списываем остатки сразу и без гонок: блокировка строк + условный UPDATE
+                try:
+                    stock.reserve({line.product: line.quantity for line in totals.lines}, owner=cart.holds_owner)
+                except stock.InsufficientStock as e:
+                    errors.append(e.message)
+
+            if errors:
+                for error in errors:
+                    form.add_error(None, error)
+                postcards = Postcard.objects.filter(is_active=True).order_by('price', 'order')
+                return render(request, 'orders/create.html', {
+                    'cart': cart,
+                    'totals': totals,
+                    'form': form,
+                    'postcards': postcards,
+                    'delivery_cost_js': site_settings.delivery_cost,
+                    'cart_total_js': totals.total_after_discount
+                })
 
             # Создание заказа (форма сама установит postcard и postcard_final_price)
             order = form.save(commit=False)
             order.user = request.user
 
-            # Отладочная информация
-            print(f"DEBUG views.py: order.postcard = {order.postcard}")
-            print(f"DEBUG views.py: order.postcard_final_price = {order.postcard_final_price}")
-
             # Промокоды
-            if hasattr(cart, 'promo') and cart.promo:
-                order.promo_code = cart.promo
-                order.discount = cart.promo.discount
+            if totals.promo:
+                order.promo_code = totals.promo
+                order.discount = totals.promo.discount
 
             # Доставка и профиль
             if form.cleaned_data['delivery_option'] == 'delivery':
@@ -71,44 +75,29 @@ def order_create(request):
             else:
                 order.delivery_cost = Decimal('0.00')
 
-            # Сохраняем заказ (postcard_final_price уже установлена в форме)
-            order.save()
-
-            # Если есть кастомное фото, сохраняем его
+            # Если есть кастомное фото - сохраняется вместе с заказом, одним save()
             if 'custom_postcard_image' in request.FILES:
-                print("DEBUG views.py: Сохранение кастомного фото")
                 order.custom_postcard_image = request.FILES['custom_postcard_image']
-                order.save(update_fields=['custom_postcard_image'])
 
-            # Создание позиций и обновление остатков
-            products_to_update = []
-            for item in cart:
-                product = item['product']
-                product.stock -= item['quantity']
-                products_to_update.append(product)
+            # Итоги заказа считаются в save() из стоимости товаров
+            order.items_total = totals.items_total
+            order.items_search = Order.build_items_search(line.product for line in totals.lines)
 
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    price=item['price'],
-                    quantity=item['quantity']
-                )
+            # Сохраняем заказ (postcard_final_price уже установлена в форме)
+            order.save()
 
-            Product.objects.bulk_update(products_to_update, ['stock'])
+            # Создание позиций одним INSERT (остатки уже списаны выше)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=line.product, price=line.price, quantity=line.quantity)
+                for line in totals.lines
+            ])
 
-            # Очистка корзины
+            # Очистка корзины (вместе с промокодом) и броней
+            holds.release(cart.holds_owner)
             cart.clear()
 
-            if 'promo_id' in request.session:
-                del request.session['promo_id']
-
-            # Отправка email
-            base_url = f"{request.scheme}://{request.get_host()}"
-            async_task(
-                'orders.utils.send_order_creation_emails_task',
-                order_id=order.id,
-                base_url=base_url
-            )
+            # Письма уйдут после коммита через исходящую очередь (orders/outbox.py)
+            outbox.record(order, OrderEvent.CREATED, base_url=f"{request.scheme}://{request.get_host()}")
 
             request.session['order_id'] = order.id
             return redirect('orders:order_created')
@@ -124,19 +113,18 @@ def order_create(request):
         }
         form = OrderCreateForm(initial=initial_data)
 
-    postcards = Postcard.objects.filter(is_active=True).order_by('price', 'order')
+        # Бронируем товары корзины на время оформления (если включено)
+        holds.hold_cart(cart.holds_owner, {line.product.id: line.quantity for line in totals.lines})
 
-    if hasattr(cart, 'get_total_price_after_discount'):
-        cart_total_js = cart.get_total_price_after_discount()
-    else:
-        cart_total_js = cart.get_total_price()
+    postcards = Postcard.objects.filter(is_active=True).order_by('price', 'order')
 
     return render(request, 'orders/create.html', {
         'cart': cart,
+        'totals': totals,
         'form': form,
         'postcards': postcards,
         'delivery_cost_js': site_settings.delivery_cost,
-        'cart_total_js': cart_total_js
+        'cart_total_js': totals.total_after_discount
     })
 
 
@@ -175,9 +163,6 @@ def one_click_order(request, product_id):
     form = OneClickOrderForm(request.POST)
 
     if form.is_valid():
-        if product.stock < 1:
-            return JsonResponse({'success': False, 'error': 'Товара нет в наличии'})
-
         order = form.save(commit=False)
         order.is_one_click = True
         order.email = 'fast-order@no-email.com'
@@ -191,24 +176,25 @@ def one_click_order(request, product_id):
         if request.user.is_authenticated:
             order.user = request.user
 
-        order.save()
+        order.items_total = product.price
+        order.items_search = Order.build_items_search([product])
 
-        OrderItem.objects.create(
-            order=order,
-            product=product,
-            price=product.price,
-            quantity=1
-        )
+        try:
+            with transaction.atomic():
+                # Списание и заказ в одной транзакции: если товара нет, заказ не создается
+                stock.reserve({product: 1})
+                order.save()
 
-        product.stock -= 1
-        product.save()
+                OrderItem.objects.create(
+                    order=order,
+                    product=product,
+                    price=product.price,
+                    quantity=1
+                )
 
-        base_url = f"{request.scheme}://{request.get_host()}"
-        async_task(
-            'orders.utils.send_order_creation_emails_task',
-            order_id=order.id,
-            base_url=base_url
-        )
+                outbox.record(order, OrderEvent.CREATED, base_url=f"{request.scheme}://{request.get_host()}")
+        except stock.InsufficientStock:
+            return JsonResponse({'success': False, 'error': 'Товара нет в наличии'})
 
         return JsonResponse({'success': True, 'order_id': order.id})
 
@@ -223,8 +209,15 @@ def get_time_slots(request):
     if not date_str:
         return JsonResponse({'error': 'Date required'}, status=400)
 
-    slots = generate_time_slots(date_str, mode=delivery_type)
-    return JsonResponse({'slots': slots})
+    # Сетка интервалов берется из кэша (orders/slots.py), отсекается только прошедшее время
+    return JsonResponse({'slots': slots.slots_for_date(date_str, mode=delivery_type)})
+
+
+@require_GET
+def get_week_slots(request):
+    """Интервалы сразу на неделю: календарь не ходит на сервер при каждой смене даты."""
+    delivery_type = request.GET.get('type', 'delivery')
+    return JsonResponse({'days': slots.week_slots(request.GET.get('start'), mode=delivery_type)})
 
 
 @require_GET
@@ -6,12 +6,14 @@ from django.views.decorators.http import require_POST
 from django.contrib import messages
 from .models import PromoCode
 from .forms import PromoApplyForm
+from cart.cart import Cart
 
 
 @require_POST
 def apply_promo(request):
     now = timezone.now()
     form = PromoApplyForm(request.POST)
+    cart = Cart(request)
 
     if form.is_valid():
         code = form.cleaned_data['code']
@@ -23,11 +25,11 @@ def apply_promo(request):
                 valid_to__gte=now,
                 active=True
             )
-            # Сохраняем ID промокода в сессию пользователя
-            request.session['promo_id'] = promo.id
+            # Сохраняем ID промокода в корзине пользователя
+            cart.set_promo(promo.id)
             messages.success(request, f"Промокод {promo.code} применен! Скидка {promo.discount}%")
         except PromoCode.DoesNotExist:
-            request.session['promo_id'] = None
+            cart.set_promo(None)
             messages.error(request, "Промокод не найден, истек или неактивен.")
 
     return redirect('cart:cart_detail')
\ No newline at end of file
@@ -7,17 +7,17 @@ from django.urls import path
 from django.shortcuts import redirect
 from django.conf import settings
 from django.http import FileResponse
-from django.core.management import call_command
 from django.contrib import messages
+from django.utils import timezone
 import os
 import subprocess
 import zipfile
 import io
-from io import StringIO
 
 from solo.admin import SingletonModelAdmin
 from adminsortable2.admin import SortableAdminMixin
 
+from . import renumbering
 from .models import (Category, Product, SiteSettings, FooterPage, ProductImage, Banner, Benefit, Postcard)
 from .forms import SiteSettingsForm, BannerAdminForm, ProductAdminForm, SliderSettingsForm, PostcardSettingsForm
 
@@ -463,24 +463,44 @@ class SiteSettingsAdmin(SingletonModelAdmin):
             if obj.mobile_font_scale > 50 or obj.mobile_font_scale < -50:
                 obj.mobile_font_scale = 0
         super().save_model(request, obj, form, change)
+        # Перенумерация идет фоновой задачей django-q, ход виден рядом с кнопкой
         if '_run_sku_script' in request.POST:
-            out = StringIO()
-            call_command('fix_skus', stdout=out)
-            self.message_user(request, "Настройки сохранены. Артикулы обновлены!", level='success')
+            self._start_renumbering(request, renumbering.SKUS)
         if '_run_order_script' in request.POST:
-            out = StringIO()
-            call_command('fix_order_ids', stdout=out)
-            self.message_user(request, "Настройки сохранены. Заказы перенумерованы!", level='success')
+            self._start_renumbering(request, renumbering.ORDERS)
+
+    def _start_renumbering(self, request, kind):
+        title = renumbering.JOB_TITLES[kind]
+        if renumbering.start_job(kind):
+            self.message_user(request, f"Настройки сохранены. {title} запущена в фоне.", level='success')
+        else:
+            self.message_user(request, f"Настройки сохранены. {title} уже выполняется.", level='warning')
+
+    def _renumbering_status(self, kind):
+        status = renumbering.get_status(kind)
+        if not status:
+            return ''
+        step = f" ({status['step']}/{status['steps']})" if status['state'] == 'running' else ''
+        color = {'done': '#28a745', 'error': '#dc3545'}.get(status['state'], '#e0a800')
+        stale = " - нет ответа от воркера, можно запустить заново" if renumbering.is_stale(status) else ''
+        return format_html(
+            '<div style="margin-top: 6px; color: {};">{}{} - {}{}</div>',
+            color, status['message'], step, timezone.localtime(status['updated']).strftime('%d.%m.%Y %H:%M'), stale
+        )
 
     def apply_sku_logic_button(self, obj):
-        return mark_safe(
-            '<button type="submit" name="_run_sku_script" value="1" style="background:#28a745; color:white; border:none; padding:8px 15px; border-radius:4px; cursor:pointer;">💾 Сохранить и Обновить артикулы</button>')
+        return format_html(
+            '{}{}',
+            mark_safe('<button type="submit" name="_run_sku_script" value="1" style="background:#28a745; color:white; border:none; padding:8px 15px; border-radius:4px; cursor:pointer;">💾 Сохранить и Обновить артикулы</button>'),
+            self._renumbering_status(renumbering.SKUS))
 
     apply_sku_logic_button.short_description = "Действие"
 
     def apply_order_logic_button(self, obj):
-        return mark_safe(
-            '<button type="submit" name="_run_order_script" value="1" style="background:#dc3545; color:white; border:none; padding:8px 15px; border-radius:4px; cursor:pointer;">💾 Сохранить и Перенумеровать заказы</button>')
+        return format_html(
+            '{}{}',
+            mark_safe('<button type="submit" name="_run_order_script" value="1" style="background:#dc3545; color:white; border:none; padding:8px 15px; border-radius:4px; cursor:pointer;">💾 Сохранить и Перенумеровать заказы</button>'),
+            self._renumbering_status(renumbering.ORDERS))
 
     apply_order_logic_button.short_description = "Действие"
 
@@ -0,0 +1,29 @@
+# shop/cards.py
+
+"""
+Подготовка карточек товаров для списков (каталог, главная, поиск, избранное).
+
+Настройки сайта читаются один раз на весь список, скидки и ссылки на превью
+считаются заранее, поэтому шаблон карточки не делает запросов.
+"""
+
+from .models import SiteSettings
+
+
+def build_product_cards(products):
+    """
+    Заполняет product.card для каждого товара и возвращает список товаров.
+    Принимает QuerySet или любой итерируемый объект с товарами.
+    """
+    products = list(products)
+    if not products:
+        return products
+
+    try:
+        site_settings = SiteSettings.get_solo()
+    except:
+        site_settings = None
+
+    for product in products:
+        product.card = product.get_card_data(site_settings)
+    return products
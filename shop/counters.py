@@ -0,0 +1,51 @@
+# shop/counters.py
+
+"""
+Атомарные счетчики в строке таблицы shop_counter.
+
+Номер выдается одним UPDATE ... SET value = value + n и чтением в той же
+транзакции. UPDATE блокирует строку (в SQLite - всю базу на запись),
+поэтому параллельные воркеры получают разные номера без MAX() по таблице.
+"""
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .models import Counter
+
+
+def allocate(name, count=1, floor=1, seed=None):
+    """
+    Выдает count номеров подряд и возвращает первый из них.
+    floor - минимальный номер (например, "начальный номер" из настроек),
+    seed - функция, которая возвращает последний уже занятый номер;
+    вызывается один раз, когда строки счетчика еще нет.
+    """
+    with transaction.atomic():
+        updated = Counter.objects.filter(name=name).update(
+            value=Greatest(F('value') + count, floor + count - 1)
+        )
+        if not updated:
+            start = max((seed() if seed else 0) or 0, floor - 1)
+            try:
+                with transaction.atomic():
+                    Counter.objects.create(name=name, value=start + count)
+                return start + 1
+            except IntegrityError:
+                # Строку только что создал другой процесс - просто увеличиваем
+                Counter.objects.filter(name=name).update(
+                    value=Greatest(F('value') + count, floor + count - 1)
+                )
+        value = Counter.objects.filter(name=name).values_list('value', flat=True).get()
+    return value - count + 1
+
+
+def advance(name, value):
+    """Поднимает счетчик до value, если он меньше (номер занят вручную)."""
+    Counter.objects.filter(name=name).update(value=Greatest(F('value'), value))
+
+
+def set_value(name, value):
+    """Задает последний выданный номер (следующим будет value + 1)."""
+    Counter.objects.update_or_create(name=name, defaults={'value': value})
@@ -0,0 +1,98 @@
+# shop/management/commands/benchmark_broker.py
+
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+# Отдельная очередь, чтобы не задеть настоящие задачи
+BENCHMARK_QUEUE = 'benchmark_broker'
+
+
+def _orm_broker():
+    from django_q.brokers.orm import ORM
+    return ORM(list_key=BENCHMARK_QUEUE)
+
+
+def _redis_broker(fake=False):
+    from django_q.brokers.redis_broker import Redis
+    if not fake:
+        return Redis(list_key=BENCHMARK_QUEUE)
+    try:
+        import fakeredis
+    except ImportError:
+        raise CommandError("Для --broker fakeredis установите пакет fakeredis.")
+    broker = Redis.__new__(Redis)
+    broker.list_key = BENCHMARK_QUEUE
+    broker.connection = fakeredis.FakeStrictRedis()
+    return broker
+
+
+def _ms(seconds):
+    return f"{seconds * 1000:.2f} мс"
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает брокеры django-q: задержка постановки/выборки задач, глубина очереди и запросы к БД.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--broker', choices=['orm', 'redis', 'fakeredis', 'all'], default='all')
+        parser.add_argument('--tasks', type=int, default=1000, help='Сколько задач поставить в очередь')
+
+    def handle(self, *args, **options):
+        names = ['orm', 'redis', 'fakeredis'] if options['broker'] == 'all' else [options['broker']]
+        for name in names:
+            try:
+                broker = _orm_broker() if name == 'orm' else _redis_broker(fake=(name == 'fakeredis'))
+                if not broker.ping():
+                    raise ConnectionError('нет ответа')
+            except CommandError as e:
+                self.stdout.write(f"[{name}] пропущен: {e}")
+                continue
+            except Exception as e:
+                self.stdout.write(f"[{name}] недоступен: {e}")
+                continue
+            self.run(name, broker, options['tasks'])
+
+    def run(self, name, broker, count):
+        broker.delete_queue()
+        payload = 'x' * 512  # примерно размер упакованной задачи
+
+        enqueue_times = []
+        with CaptureQueriesContext(connection) as enqueue_queries:
+            for _ in range(count):
+                started = time.perf_counter()
+                broker.enqueue(payload)
+                enqueue_times.append(time.perf_counter() - started)
+        depth = broker.queue_size()
+
+        dequeued = 0
+        dequeue_started = time.perf_counter()
+        with CaptureQueriesContext(connection) as dequeue_queries:
+            while dequeued < count:
+                tasks = broker.dequeue()
+                if not tasks:
+                    break
+                for task_id, _task in tasks:
+                    broker.acknowledge(task_id)
+                dequeued += len(tasks)
+        dequeue_total = time.perf_counter() - dequeue_started
+
+        broker.delete_queue()
+
+        self.stdout.write(f"[{name}] задач: {count}, глубина очереди после постановки: {depth}")
+        self.stdout.write(
+            f"  постановка: среднее {_ms(statistics.mean(enqueue_times))}, "
+            f"p95 {_ms(_percentile(enqueue_times, 95))}, всего {_ms(sum(enqueue_times))}"
+        )
+        self.stdout.write(f"  выборка + подтверждение: {dequeued} задач за {_ms(dequeue_total)}")
+        self.stdout.write(
+            f"  запросов к основной БД: постановка {len(enqueue_queries)}, выборка {len(dequeue_queries)}"
+        )
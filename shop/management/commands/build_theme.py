@@ -0,0 +1,18 @@
+# shop/management/commands/build_theme.py
+
+from django.core.management.base import BaseCommand
+from shop.models import SiteSettings
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает CSS-тему сайта из настроек (запускать после деплоя).'
+
+    def handle(self, *args, **options):
+        site_settings = SiteSettings.get_solo()
+        # save() сам собирает тему и раздает новую версию настроек всем процессам
+        site_settings.save()
+
+        if site_settings.theme_stylesheet:
+            self.stdout.write(f"Готово! Тема: {site_settings.theme_stylesheet}")
+        else:
+            self.stdout.write("Не удалось собрать тему, сайт использует встроенные стили.")
@@ -1,32 +1,19 @@
 # shop/management/commands/fix_skus.py
 
 from django.core.management.base import BaseCommand
-from shop.models import Product, SiteSettings
+from shop import renumbering, skus
+
 
 class Command(BaseCommand):
     help = 'Переписывает артикулы ВСЕМ товарам.'
 
     def handle(self, *args, **options):
-        try:
-            start_num = SiteSettings.get_solo().sku_start_number
-        except:
-            start_num = 11287
-
-        products = Product.objects.all().order_by('id')
-        count = products.count()
+        start_num = skus.start_number()
 
+        # Один UPDATE с ROW_NUMBER() вместо save() для каждого товара
+        count = renumbering.renumber_skus(start_num)
         if count == 0:
             self.stdout.write("Нет товаров.")
             return
 
-        self.stdout.write("Сброс текущих артикулов...")
-        # Сначала обнуляем, чтобы избежать конфликтов уникальности
-        Product.objects.all().update(sku=None)
-
-        current = start_num
-        for p in products:
-            p.sku = str(current)
-            p.save()
-            current += 1
-
-        self.stdout.write(f"Готово! Артикулы обновлены с {start_num}.")
\ No newline at end of file
+        self.stdout.write(f"Готово! Артикулы обновлены с {start_num} ({count} шт.).")
@@ -2,7 +2,6 @@
 
 import pytz
 from django.utils import timezone
-from django.core.cache import cache
 from .models import SiteSettings
 
 class SiteTimezoneMiddleware:
@@ -10,20 +9,13 @@ class SiteTimezoneMiddleware:
         self.get_response = get_response
 
     def __call__(self, request):
-        # 1. Пробуем взять из кэша
-        tzname = cache.get('active_site_timezone')
+        # 1. Берем зону из настроек (копия в памяти процесса, без запроса к БД)
+        try:
+            tzname = SiteSettings.get_solo().site_time_zone
+        except:
+            tzname = 'Europe/Moscow'
 
-        if not tzname:
-            try:
-                # 2. Если нет в кэше, берем из БД
-                settings = SiteSettings.get_solo()
-                tzname = settings.site_time_zone
-                # Кэшируем на час
-                cache.set('active_site_timezone', tzname, 3600)
-            except:
-                tzname = 'Europe/Moscow'
-
-        # 3. Активируем зону
+        # 2. Активируем зону
         if tzname:
             timezone.activate(pytz.timezone(tzname))
         else:
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0016_alter_postcard_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sitesettings',
+            name='theme_stylesheet',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='Файл темы (CSS)'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2 on 2026-10-18 11:00
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Триггер и GIN-индекс создаются только на PostgreSQL (на SQLite поле просто пустое)
+CREATE_SQL = """
+CREATE OR REPLACE FUNCTION shop_product_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(NEW.composition, '')), 'B') ||
+        setweight(to_tsvector('russian', coalesce(NEW.description, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER shop_product_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, composition, description ON shop_product
+    FOR EACH ROW EXECUTE PROCEDURE shop_product_search_vector_update();
+
+UPDATE shop_product SET search_vector =
+    setweight(to_tsvector('russian', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('russian', coalesce(composition, '')), 'B') ||
+    setweight(to_tsvector('russian', coalesce(description, '')), 'C');
+
+CREATE INDEX shop_product_search_vector_gin ON shop_product USING gin (search_vector);
+"""
+
+DROP_SQL = """
+DROP INDEX IF EXISTS shop_product_search_vector_gin;
+DROP TRIGGER IF EXISTS shop_product_search_vector_trigger ON shop_product;
+DROP FUNCTION IF EXISTS shop_product_search_vector_update();
+"""
+
+
+def create_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SQL, params=None)
+
+
+def drop_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SQL, params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0018_product_shop_produc_name_9fbd0c_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_trigger, drop_search_trigger),
+    ]
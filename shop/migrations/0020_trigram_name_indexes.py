@@ -0,0 +1,37 @@
+# Generated by Django 4.2 on 2026-10-18 12:00
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Триграммные индексы для подсказок поиска (только PostgreSQL)
+CREATE_SQL = """
+CREATE INDEX IF NOT EXISTS shop_product_name_trgm ON shop_product USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS shop_category_name_trgm ON shop_category USING gin (name gin_trgm_ops);
+"""
+
+DROP_SQL = """
+DROP INDEX IF EXISTS shop_product_name_trgm;
+DROP INDEX IF EXISTS shop_category_name_trgm;
+"""
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SQL, params=None)
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SQL, params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0019_product_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-18 14:30
+
+from django.db import migrations
+
+
+def seed_sku_counter(apps, schema_editor):
+    # Счетчик артикулов продолжает с наибольшего числового артикула
+    Product = apps.get_model('shop', 'Product')
+    Counter = apps.get_model('shop', 'Counter')
+    numbers = [int(sku) for sku in Product.objects.exclude(sku=None).values_list('sku', flat=True) if sku.isdigit()]
+    Counter.objects.update_or_create(name='product_sku', defaults={'value': max(numbers, default=0)})
+
+
+def delete_sku_counter(apps, schema_editor):
+    Counter = apps.get_model('shop', 'Counter')
+    Counter.objects.filter(name='product_sku').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0021_counter'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_sku_counter, delete_sku_counter),
+    ]
@@ -8,10 +8,13 @@ from solo.models import SingletonModel
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.html import format_html
-from django.db.models import Max
+from django.utils.functional import cached_property
+from django.contrib.postgres.search import SearchVectorField
+from django.core.files.storage import default_storage
 import pytz
 from datetime import datetime
-from django.core.cache import cache
+
+from . import settings_cache, theme
 
 # --- КОНСТАНТЫ ВЫБОРА ---
 
@@ -178,9 +181,25 @@ class SiteSettings(SingletonModel):
         help_text="Влияет на работу промокодов и отображение времени заказов."
     )
 
+    @classmethod
+    def get_solo(cls):
+        # Настройки берутся из памяти процесса, в БД идем только при смене версии
+        return settings_cache.get_settings(super().get_solo)
+
     def save(self, *args, **kwargs):
-        cache.delete('active_site_timezone')
+        # Пересобираем CSS-тему. Если не получилось - base.html встроит тему инлайном
+        try:
+            self.theme_stylesheet = theme.compile_theme(self)
+        except Exception as e:
+            print(f"Ошибка сборки темы: {e}")
+            self.theme_stylesheet = ''
         super().save(*args, **kwargs)
+        settings_cache.publish(self)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        settings_cache.invalidate()
+        return result
 
         # Цена за печать своего фото
     custom_postcard_price = models.DecimalField(
@@ -417,12 +436,21 @@ class SiteSettings(SingletonModel):
     static_page_link_color = models.CharField("Цвет ссылок", max_length=7, blank=True)
     static_page_link_hover_color = models.CharField("Цвет ссылок при наведении", max_length=7, blank=True)
 
+    # Путь к собранному CSS темы (shop/theme.py), заполняется автоматически
+    theme_stylesheet = models.CharField("Файл темы (CSS)", max_length=255, blank=True, editable=False)
+
     class Meta:
         verbose_name = "Настройки сайта"
 
     def __str__(self):
         return format_html("{}", "Настройки сайта")
 
+    @property
+    def theme_stylesheet_url(self):
+        if not self.theme_stylesheet:
+            return ''
+        return default_storage.url(self.theme_stylesheet)
+
     # ... (методы _get_rgb и property opacity_css оставляем как были) ...
     def _get_rgb(self, hex_color):
         if not hex_color: return '255, 255, 255'
@@ -520,24 +548,29 @@ class Product(models.Model):
     created = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
+    # Поисковый вектор PostgreSQL: название (вес A), состав (B), описание (C).
+    # Заполняется триггером в БД (миграция 0019) и GIN-индексирован, в коде не меняется.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Артикул, с которым товар загружен (None, если поле отложено через .only())
+        instance._loaded_sku = instance.__dict__.get('sku')
+        return instance
+
     def save(self, *args, **kwargs):
-        cache.delete('active_site_timezone')
-        if not self.sku:
-            try:
-                start_num = SiteSettings.get_solo().sku_start_number
-            except:
-                start_num = 11287
-            max_sku_dict = Product.objects.aggregate(Max('sku'))
-            max_sku = max_sku_dict['sku__max']
-            next_val = start_num
-            if max_sku and max_sku.isdigit():
-                potential_next = int(max_sku) + 1
-                if potential_next > start_num:
-                    next_val = potential_next
-            while Product.objects.filter(sku=str(next_val)).exists():
-                next_val += 1
-            self.sku = str(next_val)
+        # Артикул из счетчика (shop/skus.py), без Max('sku') и перебора
+        from . import skus
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'sku' in update_fields:
+            if not self.sku:
+                self.sku = skus.allocate()[0]
+            elif self._state.adding or self.sku != getattr(self, '_loaded_sku', None):
+                # Артикул введен или изменен вручную
+                skus.reserve_manual(self.sku)
         super().save(*args, **kwargs)
+        self._loaded_sku = self.sku
 
     def get_discount_percent(self):
         try:
@@ -550,32 +583,50 @@ class Product(models.Model):
         except (TypeError, ValueError):
             return 0
 
-    def get_discount_sticker_color(self):
+    def get_discount_sticker_color(self, site_settings=None):
         if self.discount_sticker_color and self.discount_sticker_color != '#000000':
             return self.discount_sticker_color
         try:
-            site_settings = SiteSettings.get_solo()
+            site_settings = site_settings or SiteSettings.get_solo()
             if site_settings.default_discount_sticker_color and site_settings.default_discount_sticker_color != '#000000':
                 return site_settings.default_discount_sticker_color
         except:
             pass
         return '#e85454'
 
-    def get_new_price_color(self):
+    def get_new_price_color(self, site_settings=None):
         if self.new_price_color and self.new_price_color != '#000000':
             return self.new_price_color
         try:
-            site_settings = SiteSettings.get_solo()
+            site_settings = site_settings or SiteSettings.get_solo()
             if site_settings.default_new_price_color and site_settings.default_new_price_color != '#000000':
                 return site_settings.default_new_price_color
         except:
             pass
         return '#e53935'
 
+    def get_card_data(self, site_settings=None):
+        """Все, что нужно шаблону карточки товара (shop/includes/product_card.html)"""
+        has_discount = bool(self.old_price and self.price and self.old_price > self.price)
+        return {
+            'thumbnail_url': self.image_thumbnail.url if self.image else '',
+            'has_discount': has_discount,
+            'discount_percent': self.get_discount_percent() if has_discount else 0,
+            'sticker_color': self.get_discount_sticker_color(site_settings) if has_discount else '',
+            'new_price_color': self.get_new_price_color(site_settings) if has_discount else '',
+        }
+
+    @cached_property
+    def card(self):
+        # Для списков товаров заполняется пачкой через shop.cards.build_product_cards
+        return self.get_card_data()
+
     class Meta:
         ordering = ['name']
         indexes = [models.Index(fields=['id', 'slug']), models.Index(fields=['name']),
-                   models.Index(fields=['-created'])]
+                   models.Index(fields=['-created']),
+                   # Для постраничного каталога по курсору (shop/pagination.py)
+                   models.Index(fields=['name', 'id']), models.Index(fields=['price', 'id'])]
         verbose_name = 'Товар'
         verbose_name_plural = 'Товары'
         #ordering = ['order']  # Это важно для сортировки
@@ -690,4 +741,19 @@ class Postcard(models.Model):
 
     def __str__(self):
         type_str = "Платная" if self.price > 0 else "Бесплатная"
-        return f"{self.title} ({type_str})"
\ No newline at end of file
+        return f"{self.title} ({type_str})"
+
+class Counter(models.Model):
+    """
+    Счетчик для выдачи номеров (см. shop/counters.py).
+    Одна строка на счетчик, value - последний выданный номер.
+    """
+    name = models.CharField("Счетчик", max_length=50, primary_key=True)
+    value = models.BigIntegerField("Последнее значение", default=0)
+
+    class Meta:
+        verbose_name = 'Счетчик'
+        verbose_name_plural = 'Счетчики'
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
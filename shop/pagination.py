@@ -0,0 +1,116 @@
+# shop/pagination.py
+
+"""
+Постраничный вывод каталога по курсору (keyset), без OFFSET.
+
+Курсор хранит значение поля сортировки и id последнего товара на странице.
+Следующая страница выбирается условием "после этой пары", поэтому стоимость
+запроса не растет с номером страницы.
+"""
+
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+
+PAGE_SIZE = 24
+
+# Ключ из GET -> (поле, по убыванию?, название для шаблона)
+SORT_OPTIONS = {
+    'name': ('name', False, 'По названию'),
+    'price': ('price', False, 'Сначала дешевле'),
+    'price_desc': ('price', True, 'Сначала дороже'),
+    'new': ('created', True, 'Новинки'),
+}
+DEFAULT_SORT = 'name'
+
+
+def get_sort(params):
+    sort = params.get('sort', DEFAULT_SORT)
+    return sort if sort in SORT_OPTIONS else DEFAULT_SORT
+
+
+def _parse_price(value):
+    if not value:
+        return None
+    try:
+        return Decimal(value.replace(',', '.'))
+    except (InvalidOperation, AttributeError):
+        return None
+
+
+def apply_filters(queryset, params):
+    """Фильтры каталога из GET: price_min, price_max, in_stock."""
+    price_min = _parse_price(params.get('price_min'))
+    price_max = _parse_price(params.get('price_max'))
+    if price_min is not None:
+        queryset = queryset.filter(price__gte=price_min)
+    if price_max is not None:
+        queryset = queryset.filter(price__lte=price_max)
+    if params.get('in_stock'):
+        queryset = queryset.filter(stock__gt=0)
+    return queryset
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _decode_value(field, raw):
+    if field == 'price':
+        return Decimal(raw)
+    if field == 'created':
+        return datetime.fromisoformat(raw)
+    return raw
+
+
+def encode_cursor(sort, product):
+    field = SORT_OPTIONS[sort][0]
+    data = json.dumps([sort, _encode_value(getattr(product, field)), product.id])
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(sort, cursor):
+    """Возвращает (значение, id) или None, если курсор битый или от другой сортировки."""
+    if not cursor:
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        cursor_sort, raw_value, last_id = data
+        if cursor_sort != sort:
+            return None
+        return _decode_value(SORT_OPTIONS[sort][0], raw_value), int(last_id)
+    except (ValueError, TypeError, InvalidOperation, UnicodeError):
+        return None
+
+
+def keyset_page(queryset, sort, cursor=None, page_size=PAGE_SIZE):
+    """
+    Возвращает (список товаров, курсор следующей страницы или None).
+    Запрашивает page_size + 1 строк, чтобы узнать, есть ли продолжение.
+    """
+    field, descending, _ = SORT_OPTIONS[sort]
+
+    if descending:
+        queryset = queryset.order_by(f'-{field}', '-id')
+    else:
+        queryset = queryset.order_by(field, 'id')
+
+    position = decode_cursor(sort, cursor)
+    if position:
+        value, last_id = position
+        if descending:
+            queryset = queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': last_id}))
+        else:
+            queryset = queryset.filter(Q(**{f'{field}__gt': value}) | Q(**{field: value, 'id__gt': last_id}))
+
+    products = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(products) > page_size:
+        products = products[:page_size]
+        next_cursor = encode_cursor(sort, products[-1])
+    return products, next_cursor
@@ -0,0 +1,201 @@
+# shop/renumbering.py
+
+"""
+Перенумерация заказов и артикулов (кнопки в "Настройках сайта").
+
+Раньше каждая строка обновлялась отдельным запросом (4 UPDATE на заказ,
+save() на товар), и на десятках тысяч заказов воркер gunicorn падал по таймауту.
+Теперь это несколько UPDATE на всю таблицу, а из админки запускается
+фоновая задача django-q. Ход выполнения пишется в кэш и показывается
+в настройках сайта.
+
+Задача ставится в очередь после коммита сохранения настроек. Каждый шаг
+обновляет время в статусе (heartbeat). Если статус queued/running давно
+не обновлялся (воркер упал), задачу можно запустить заново.
+"""
+
+import uuid
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django_q.tasks import async_task
+
+from orders import numbering
+from orders.models import Order
+from . import skus
+
+JOB_CACHE_PREFIX = 'renumber_job:'
+JOB_CACHE_TTL = 60 * 60 * 24
+
+# Через сколько минут без обновления статуса задача считается зависшей.
+# Больше, чем timeout + retry задачи в Q_CLUSTER (90 + 120 сек).
+STALE_MINUTES = 5
+
+ORDERS = 'orders'
+SKUS = 'skus'
+
+JOB_TITLES = {
+    ORDERS: 'Перенумерация заказов',
+    SKUS: 'Обновление артикулов',
+}
+
+
+# === Ход выполнения ===
+
+def get_status(kind):
+    """Состояние последней задачи: {'state', 'step', 'steps', 'message', 'updated'} или None."""
+    return cache.get(JOB_CACHE_PREFIX + kind)
+
+
+def _set_status(kind, job_id, state, message, step=0, steps=0):
+    cache.set(JOB_CACHE_PREFIX + kind, {
+        'job_id': job_id,
+        'state': state,
+        'step': step,
+        'steps': steps,
+        'message': message,
+        'updated': timezone.now(),
+    }, JOB_CACHE_TTL)
+
+
+def is_stale(status):
+    """Задача в очереди или в работе, но статус давно не обновлялся (воркер упал)."""
+    return (
+        status['state'] in ('queued', 'running')
+        and timezone.now() - status['updated'] > timedelta(minutes=STALE_MINUTES)
+    )
+
+
+def is_running(kind):
+    status = get_status(kind)
+    return bool(status) and status['state'] in ('queued', 'running') and not is_stale(status)
+
+
+def start_job(kind):
+    """
+    Ставит перенумерацию в очередь django-q после коммита текущей транзакции.
+    Возвращает False, если она уже идет.
+    """
+    if is_running(kind):
+        return False
+    job_id = uuid.uuid4().hex
+    _set_status(kind, job_id, 'queued', 'В очереди')
+    transaction.on_commit(lambda: async_task('shop.renumbering.run_job', kind, job_id))
+    return True
+
+
+def run_job(kind, job_id=None):
+    """Задача django-q (и management-команды): выполняет перенумерацию с отчетом о ходе."""
+    status = get_status(kind)
+    if job_id and status and status['job_id'] != job_id:
+        # После зависания запущена новая задача - эта уже не нужна
+        print(f"Задача {job_id} ({kind}) пропущена: запущена задача {status['job_id']}")
+        return 0
+
+    def progress(step, steps, message):
+        _set_status(kind, job_id, 'running', message, step, steps)
+
+    try:
+        if kind == ORDERS:
+            count = renumber_orders(progress=progress)
+            result = f"Готово: перенумеровано заказов - {count}"
+        else:
+            count = renumber_skus(progress=progress)
+            result = f"Готово: обновлено артикулов - {count}"
+    except Exception as e:
+        _set_status(kind, job_id, 'error', f"Ошибка: {e}")
+        raise
+    _set_status(kind, job_id, 'done', result)
+    return count
+
+
+def _no_progress(step, steps, message):
+    pass
+
+
+# === Заказы ===
+
+# Временная таблица соответствия: старый id -> новый номер (по дате создания)
+CREATE_ORDER_MAP_SQL = """
+    CREATE TEMPORARY TABLE order_id_map AS
+    SELECT id AS old_id, %s + ROW_NUMBER() OVER (ORDER BY created, id) - 1 AS new_id
+    FROM orders_order
+"""
+
+# Таблицы со ссылкой order_id на заказ
+ORDER_REFERENCES = ('orders_orderitem', 'orders_orderevent')
+
+
+def renumber_orders(start=None, progress=_no_progress):
+    """
+    Перенумеровывает все заказы по дате создания, начиная с start
+    (по умолчанию SiteSettings.order_start_number). Возвращает количество заказов.
+    """
+    start = numbering.start_number() if start is None else start
+    steps = 4
+
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            # Новые заказы (next_order_number + INSERT) и их позиции ждут конца перенумерации,
+            # иначе заказ, созданный посреди UPDATE, остался бы вне order_id_map.
+            # Чтение таблиц не блокируется
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"LOCK TABLE orders_order, {', '.join(ORDER_REFERENCES)} IN SHARE ROW EXCLUSIVE MODE"
+                )
+
+        count = Order.objects.count()
+        if not count:
+            return 0
+        max_id = Order.objects.aggregate(Max('id'))['id__max']
+        # Временная зона выше и старых, и новых номеров - UPDATE не упрется в уникальность id
+        offset = max(max_id, start + count) + 1
+
+        with connection.cursor() as cursor:
+            # Ссылки на заказ проверяются в конце транзакции (для Postgres)
+            if connection.vendor == 'postgresql':
+                cursor.execute("SET CONSTRAINTS ALL DEFERRED")
+
+            progress(1, steps, "Расчет новых номеров")
+            cursor.execute(CREATE_ORDER_MAP_SQL, [start])
+            cursor.execute("CREATE INDEX order_id_map_old_id ON order_id_map (old_id)")
+
+            progress(2, steps, "Перенос заказов во временную зону")
+            for table in ORDER_REFERENCES:
+                cursor.execute(f"UPDATE {table} SET order_id = order_id + %s", [offset])
+            cursor.execute("UPDATE orders_order SET id = id + %s", [offset])
+
+            progress(3, steps, "Присвоение новых номеров")
+            cursor.execute(
+                "UPDATE orders_order SET id = order_id_map.new_id FROM order_id_map "
+                "WHERE orders_order.id = order_id_map.old_id + %s", [offset]
+            )
+            for table in ORDER_REFERENCES:
+                cursor.execute(
+                    f"UPDATE {table} SET order_id = order_id_map.new_id FROM order_id_map "
+                    f"WHERE {table}.order_id = order_id_map.old_id + %s", [offset]
+                )
+            cursor.execute("DROP TABLE order_id_map")
+
+        progress(4, steps, "Синхронизация счетчика номеров")
+        numbering.sync()
+    return count
+
+
+# === Артикулы ===
+
+def renumber_skus(start=None, progress=_no_progress):
+    """
+    Переписывает артикулы всем товарам (shop/skus.py) и строку поиска
+    по товарам в заказах. Возвращает количество товаров.
+    """
+    steps = 2
+    progress(1, steps, "Обновление артикулов")
+    with transaction.atomic():
+        count = skus.renumber(start)
+        progress(2, steps, "Обновление поиска по товарам в заказах")
+        Order.refresh_items_search()
+    return count
@@ -0,0 +1,425 @@
+# shop/search.py
+
+"""
+Движки поиска товаров.
+
+PostgresSearchBackend - полнотекстовый поиск PostgreSQL по search_vector (GIN).
+PythonSearchBackend - инвертированный индекс в памяти процесса со стеммингом
+по-русски и ранжированием BM25. Работает на любой БД (SQLite в разработке и тестах).
+
+Движок выбирается по settings.SEARCH_BACKEND ('postgres' / 'python'),
+по умолчанию - по типу базы.
+
+Готовые списки id результатов лежат в общем кэше (cached_search).
+"""
+
+import hashlib
+import html
+import math
+import re
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Product
+
+
+# === Стемминг (упрощенный Snowball для русского) ===
+
+_PERFECTIVE_GERUND = re.compile(r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+_REFLEXIVE = re.compile(r'(с[яь])$')
+_ADJECTIVE = re.compile(r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$')
+_PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+_VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)'
+    r'|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+_NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+_RV = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+_DERIVATIONAL = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$')
+_DER = re.compile(r'ость?$')
+_SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+_TOKEN = re.compile(r'[a-zа-яё0-9]+')
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    match = _RV.match(word)
+    if not match:
+        return word
+
+    prefix, rv = match.groups()
+    temp = _PERFECTIVE_GERUND.sub('', rv, 1)
+    if temp == rv:
+        rv = _REFLEXIVE.sub('', rv, 1)
+        temp = _ADJECTIVE.sub('', rv, 1)
+        if temp != rv:
+            rv = _PARTICIPLE.sub('', temp, 1)
+        else:
+            temp = _VERB.sub('', rv, 1)
+            rv = _NOUN.sub('', rv, 1) if temp == rv else temp
+    else:
+        rv = temp
+
+    if rv.endswith('и'):
+        rv = rv[:-1]
+    if _DERIVATIONAL.match(rv):
+        rv = _DER.sub('', rv, 1)
+    if rv.endswith('ь'):
+        rv = rv[:-1]
+    else:
+        rv = _SUPERLATIVE.sub('', rv, 1)
+        if rv.endswith('нн'):
+            rv = rv[:-1]
+    return prefix + rv
+
+
+def tokenize(text):
+    return _TOKEN.findall((text or '').lower())
+
+
+def query_terms(query):
+    """Основы слов запроса без повторов, в исходном порядке."""
+    return list(dict.fromkeys(stem(word) for word in tokenize(query)))
+
+
+# === PostgreSQL ===
+
+class PostgresSearchBackend:
+    """Полнотекстовый поиск по Product.search_vector (триггер + GIN, миграция 0019)."""
+
+    min_rank = 0.05
+    # Основы слов выделяет PostgreSQL (config='russian'), а не stem() -
+    # кэш результатов сбрасывается целиком, а не по основам
+    cache_by_terms = False
+
+    def cache_stamp(self):
+        """Результаты одинаковы во всех процессах - общий кэш на всех."""
+        return ''
+
+    def _query(self, query):
+        from django.contrib.postgres.search import SearchQuery
+        return SearchQuery(query, config='russian')
+
+    def search(self, query):
+        from django.contrib.postgres.search import SearchRank
+        from django.db.models import F
+
+        search_query = self._query(query)
+        return (
+            Product.objects.filter(available=True, search_vector=search_query)
+            .annotate(rank=SearchRank(F('search_vector'), search_query))
+            .filter(rank__gte=self.min_rank)
+            .order_by('-rank', 'id')
+            .values_list('id', flat=True)
+        )
+
+    def highlight(self, queryset, query):
+        from django.contrib.postgres.search import SearchHeadline
+
+        search_query = self._query(query)
+        return queryset.annotate(
+            highlighted_name=SearchHeadline(
+                'name', search_query, start_sel='<mark>', stop_sel='</mark>', config='russian'
+            ),
+            highlighted_description=SearchHeadline(
+                'description', search_query, start_sel='<mark>', stop_sel='</mark>', config='russian'
+            ),
+        )
+
+
+# === Python: инвертированный индекс + BM25 ===
+
+# Вес совпадения по полю (как setweight A/B/C в PostgreSQL)
+FIELD_WEIGHTS = (('name', 3), ('composition', 2), ('description', 1))
+
+# Через сколько секунд индекс пересобирается целиком
+# (сохранения из других процессов сигналы сюда не приносят)
+INDEX_TTL = 600
+
+
+class InvertedIndex:
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self.postings = defaultdict(dict)  # основа -> {id товара: взвешенная частота}
+        self.doc_terms = {}                # id товара -> {основа: частота}
+        self.doc_lengths = {}
+        self.total_length = 0
+        self.built_at = None
+        self.build_id = None
+
+    def build(self):
+        self.postings = defaultdict(dict)
+        self.doc_terms = {}
+        self.doc_lengths = {}
+        self.total_length = 0
+        fields = [name for name, _ in FIELD_WEIGHTS]
+        for product in Product.objects.filter(available=True).only('id', *fields):
+            self.add(product)
+        self.built_at = time.monotonic()
+        self.build_id = uuid.uuid4().hex
+
+    def is_stale(self):
+        return self.built_at is None or time.monotonic() - self.built_at > INDEX_TTL
+
+    def add(self, product):
+        terms = defaultdict(int)
+        for field, weight in FIELD_WEIGHTS:
+            for word in tokenize(getattr(product, field, '')):
+                terms[stem(word)] += weight
+        if not terms:
+            return
+        length = sum(terms.values())
+        self.doc_terms[product.id] = dict(terms)
+        self.doc_lengths[product.id] = length
+        self.total_length += length
+        for term, frequency in terms.items():
+            self.postings[term][product.id] = frequency
+
+    def remove(self, product_id):
+        terms = self.doc_terms.pop(product_id, None)
+        if terms is None:
+            return
+        self.total_length -= self.doc_lengths.pop(product_id)
+        for term in terms:
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(product_id, None)
+                if not docs:
+                    del self.postings[term]
+
+    def update(self, product):
+        self.remove(product.id)
+        if product.available:
+            self.add(product)
+
+    def search(self, terms):
+        """id товаров, содержащих все основы, по убыванию BM25."""
+        if not terms or not self.doc_lengths:
+            return []
+
+        postings = [self.postings.get(term, {}) for term in terms]
+        if not all(postings):
+            return []
+
+        candidates = set(postings[0])
+        for docs in postings[1:]:
+            candidates &= docs.keys()
+
+        total = len(self.doc_lengths)
+        average = self.total_length / total
+        scores = {}
+        for docs in postings:
+            idf = math.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+            for product_id in candidates:
+                frequency = docs[product_id]
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[product_id] / average)
+                scores[product_id] = scores.get(product_id, 0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        return sorted(candidates, key=lambda product_id: (-scores[product_id], product_id))
+
+
+product_index = InvertedIndex()
+
+
+def _mark(text, terms):
+    """Экранирует текст и оборачивает в <mark> слова с нужной основой."""
+    def replace(match):
+        word = match.group(0)
+        return f'<mark>{word}</mark>' if stem(word) in terms else word
+    return re.sub(r'[A-Za-zА-Яа-яЁё0-9]+', replace, html.escape(text or ''))
+
+
+class PythonSearchBackend:
+    """Поиск по индексу в памяти процесса. Индекс строится при первом поиске."""
+
+    cache_by_terms = True
+
+    def cache_stamp(self):
+        """
+        Индекс свой в каждом процессе и может отставать от базы до INDEX_TTL секунд
+        (чужие сохранения сигналы сюда не приносят). Результаты кэшируются под
+        номером сборки индекса, чтобы устаревший индекс одного процесса не отдавал
+        свою выдачу всем остальным.
+        """
+        if product_index.is_stale():
+            product_index.build()
+        return product_index.build_id
+
+    def search(self, query):
+        if product_index.is_stale():
+            product_index.build()
+        return product_index.search(query_terms(query))
+
+    def highlight(self, queryset, query):
+        terms = set(query_terms(query))
+        products = list(queryset)
+        for product in products:
+            product.highlighted_name = _mark(product.name, terms)
+            product.highlighted_description = _mark(product.description, terms)
+        return products
+
+
+@receiver(post_save, sender=Product)
+def _update_product_index(sender, instance, **kwargs):
+    if product_index.built_at is not None:
+        product_index.update(instance)
+
+
+@receiver(post_delete, sender=Product)
+def _remove_from_product_index(sender, instance, **kwargs):
+    product_index.remove(instance.id)
+
+
+# === Выбор движка ===
+
+BACKENDS = {
+    'postgres': PostgresSearchBackend,
+    'python': PythonSearchBackend,
+}
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        name = getattr(settings, 'SEARCH_BACKEND', None)
+        if name not in BACKENDS:
+            name = 'postgres' if connection.vendor == 'postgresql' else 'python'
+        _backend = BACKENDS[name]()
+    return _backend
+
+
+# === Кэш результатов ===
+
+# Сколько секунд хранится список id для запроса
+RESULTS_CACHE_TTL = 300
+
+# Для PythonSearchBackend у каждой основы слова своя версия в кэше. Ключ результата
+# собирается из версий основ запроса, поэтому изменение товара сбрасывает только
+# те запросы, в которых встречаются слова из его названия, состава или описания.
+# Для PostgresSearchBackend основы считает сама база, поэтому версия одна на все запросы.
+# В ключ входит и cache_stamp() движка: индекс PythonSearchBackend свой в каждом процессе.
+TERM_VERSION_PREFIX = 'search_term_version:'
+SEARCH_VERSION_KEY = 'search_version'
+RESULTS_PREFIX = 'search_results:'
+
+# Поля, от которых зависит попадание товара в выдачу
+SEARCH_FIELDS = ('name', 'composition', 'description', 'available')
+
+
+def _term_version_keys(terms):
+    return [TERM_VERSION_PREFIX + term for term in terms]
+
+
+def _results_key(query):
+    backend = get_backend()
+    parts = [type(backend).__name__, backend.cache_stamp(), 'available']
+    if backend.cache_by_terms:
+        terms = sorted(query_terms(query))
+        versions = cache.get_many(_term_version_keys(terms))
+        for term, key in zip(terms, _term_version_keys(terms)):
+            parts.append(f'{term}:{versions.get(key, 0)}')
+    else:
+        parts.append(str(cache.get(SEARCH_VERSION_KEY, 0)))
+        parts.extend(sorted(set(tokenize(query))))
+    return RESULTS_PREFIX + hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+def cached_search(query):
+    """
+    Список id найденных товаров (по убыванию релевантности).
+    Повторный запрос с теми же словами берется из кэша без ранжирования.
+    """
+    if not tokenize(query):
+        return []
+
+    key = _results_key(query)
+    ids = cache.get(key)
+    if ids is None:
+        ids = list(get_backend().search(query))
+        cache.set(key, ids, RESULTS_CACHE_TTL)
+    return ids
+
+
+def _product_terms(values):
+    terms = set()
+    for field in ('name', 'composition', 'description'):
+        terms.update(stem(word) for word in tokenize(values.get(field)))
+    return terms
+
+
+def invalidate_terms(terms):
+    """Сбрасывает кэш всех запросов, содержащих эти основы."""
+    if terms:
+        token = uuid.uuid4().hex
+        cache.set_many({key: token for key in _term_version_keys(terms)}, None)
+
+
+def invalidate_products(*values):
+    """Сбрасывает кэш запросов, в выдачу которых могли попасть товары с такими полями."""
+    if get_backend().cache_by_terms:
+        terms = set()
+        for product_values in values:
+            terms |= _product_terms(product_values)
+        invalidate_terms(terms)
+    else:
+        cache.set(SEARCH_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def _search_values(instance):
+    """Поля поиска, уже загруженные в объект (отложенные поля не читаем - это запрос)."""
+    return {field: instance.__dict__[field] for field in SEARCH_FIELDS if field in instance.__dict__}
+
+
+def _saves_search_fields(update_fields):
+    return update_fields is None or bool(set(update_fields) & set(SEARCH_FIELDS))
+
+
+@receiver(post_init, sender=Product)
+def _remember_search_fields(sender, instance, **kwargs):
+    # Значения, с которыми объект загружен, - без запроса к БД
+    instance._search_fields_before = _search_values(instance)
+
+
+@receiver(pre_save, sender=Product)
+def _load_missing_search_fields(sender, instance, update_fields=None, **kwargs):
+    # Запрос нужен, только если объект загружен через .only() без части полей поиска
+    # и они сохраняются (старые слова товара надо сбросить из кэша)
+    before = getattr(instance, '_search_fields_before', None)
+    if not instance.pk or before is None or len(before) == len(SEARCH_FIELDS):
+        return
+    if not _saves_search_fields(update_fields):
+        return
+    missing = [field for field in SEARCH_FIELDS if field not in before]
+    before.update(Product.objects.filter(pk=instance.pk).values(*missing).first() or {})
+
+
+@receiver(post_save, sender=Product)
+def _invalidate_results_on_save(sender, instance, created, update_fields=None, **kwargs):
+    before = {} if created else getattr(instance, '_search_fields_before', None) or {}
+    after = _search_values(instance)
+    instance._search_fields_before = dict(after)
+    # Изменился только остаток (например, при заказе) - выдача та же
+    if not _saves_search_fields(update_fields):
+        return
+    if not created and before and all(before.get(field) == value for field, value in after.items()):
+        return
+    invalidate_products(before, after)
+
+
+@receiver(post_delete, sender=Product)
+def _invalidate_results_on_delete(sender, instance, **kwargs):
+    invalidate_products(_search_values(instance))
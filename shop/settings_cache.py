@@ -0,0 +1,102 @@
+# shop/settings_cache.py
+
+"""
+Кэш настроек сайта (SiteSettings).
+
+Каждый процесс (воркер gunicorn, qcluster) держит у себя в памяти копию
+строки настроек. Рядом с копией хранится номер версии, общий номер версии
+лежит в кэше Django. SiteSettings.save() увеличивает версию (после коммита
+транзакции), и остальные процессы перечитывают настройки из БД при следующем запросе.
+В память всегда кладется строка, заново прочитанная из БД: у только что
+созданного объекта поля времени еще хранят строковые значения по умолчанию ("09:00").
+"""
+
+import copy
+import time
+import uuid
+
+from django.core.cache import cache
+from django.core.signals import request_started
+from django.db import transaction
+from django.dispatch import receiver
+
+VERSION_CACHE_KEY = 'site_settings_version'
+
+# Как часто (сек) проверять версию вне HTTP-запросов (задачи django-q, команды)
+RECHECK_INTERVAL = 5
+
+# Снимок: (версия, объект настроек, время последней проверки версии)
+_snapshot = (None, None, 0.0)
+
+
+def _shared_version():
+    """Текущая версия из общего кэша. Если ключа нет - создаем новую."""
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_CACHE_KEY)
+    return version
+
+
+def _reload(obj):
+    """Свежая копия строки из БД (значения полей приведены к типам Python)."""
+    return type(obj)._default_manager.get(pk=obj.pk)
+
+
+def current_version():
+    """Версия настроек (для ключей кэша, которые должны сбрасываться при сохранении настроек)."""
+    version = _snapshot[0]
+    return version if version is not None else _shared_version()
+
+
+def get_settings(loader):
+    """
+    Возвращает копию настроек из памяти процесса.
+    loader - функция, которая читает настройки из БД (исходный get_solo).
+    """
+    global _snapshot
+    version, obj, checked_at = _snapshot
+    now = time.monotonic()
+
+    if obj is None or now - checked_at >= RECHECK_INTERVAL:
+        shared = _shared_version()
+        if obj is None or shared != version:
+            obj = _reload(loader())
+            version = shared
+        _snapshot = (version, obj, now)
+
+    # Отдаем копию, чтобы формы в админке не портили общий объект
+    return copy.copy(obj)
+
+
+def publish(obj):
+    """
+    Вызывается после сохранения настроек: новая версия для всех процессов.
+    Версия меняется только после коммита, иначе другие процессы успеют
+    перечитать из БД старую строку и запомнить ее под новой версией.
+    """
+    transaction.on_commit(lambda: _publish(obj))
+
+
+def _publish(obj):
+    global _snapshot
+    fresh = _reload(obj)
+    version = uuid.uuid4().hex
+    cache.set(VERSION_CACHE_KEY, version, None)
+    _snapshot = (version, fresh, time.monotonic())
+
+
+def invalidate():
+    """Сбрасывает копию в памяти и общую версию (например, после удаления)."""
+    global _snapshot
+    cache.delete(VERSION_CACHE_KEY)
+    _snapshot = (None, None, 0.0)
+
+
+@receiver(request_started)
+def _recheck_on_request(**kwargs):
+    """В начале каждого запроса версия сверяется заново (один запрос в кэш)."""
+    global _snapshot
+    version, obj, checked_at = _snapshot
+    if obj is not None:
+        _snapshot = (version, obj, 0.0)
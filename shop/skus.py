@@ -0,0 +1,70 @@
+# shop/skus.py
+
+"""
+Выдача артикулов товаров.
+
+Раньше Product.save() брал Max('sku') по текстовому полю (сортировка
+строк: '9' > '11287') и перебирал exists() до свободного номера.
+Теперь артикулы выдает атомарный счетчик (shop/counters.py), начиная с
+SiteSettings.sku_start_number. Для импорта артикулы выдаются блоком:
+один UPDATE счетчика на любую пачку товаров.
+"""
+
+from django.db import connection, transaction
+
+from . import counters
+from .models import Product, SiteSettings
+
+COUNTER_NAME = 'product_sku'
+
+
+def start_number():
+    try:
+        return SiteSettings.get_solo().sku_start_number
+    except:
+        return 11287
+
+
+def _last_numeric_sku():
+    """Наибольший числовой артикул (один раз, когда счетчика еще нет)."""
+    numbers = [int(sku) for sku in Product.objects.exclude(sku=None).values_list('sku', flat=True) if sku.isdigit()]
+    return max(numbers, default=0)
+
+
+def allocate(count=1):
+    """Выдает count новых артикулов подряд (список строк)."""
+    first = counters.allocate(COUNTER_NAME, count, floor=start_number(), seed=_last_numeric_sku)
+    return [str(number) for number in range(first, first + count)]
+
+
+def reserve_manual(sku):
+    """Артикул введен вручную - счетчик не должен выдать его повторно."""
+    if sku and sku.isdigit():
+        counters.advance(COUNTER_NAME, int(sku))
+
+
+# Новые артикулы по порядку id: start, start + 1, ...
+RENUMBER_SQL = """
+    UPDATE shop_product
+    SET sku = CAST(%s + numbered.position - 1 AS VARCHAR(20))
+    FROM (
+        SELECT id, ROW_NUMBER() OVER (ORDER BY id) AS position FROM shop_product
+    ) AS numbered
+    WHERE shop_product.id = numbered.id
+"""
+
+
+def renumber(start=None):
+    """
+    Переписывает артикулы всем товарам (по порядку id) и двигает счетчик.
+    Возвращает количество товаров.
+    """
+    start = start_number() if start is None else start
+    with transaction.atomic():
+        # Сначала обнуляем, чтобы не было конфликтов уникальности посреди UPDATE
+        Product.objects.update(sku=None)
+        with connection.cursor() as cursor:
+            cursor.execute(RENUMBER_SQL, [start])
+            count = cursor.rowcount
+        counters.set_value(COUNTER_NAME, start + count - 1)
+    return count
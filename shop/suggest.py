@@ -0,0 +1,177 @@
+# shop/suggest.py
+
+"""
+Подсказки поиска "на лету" (эндпоинт /search/suggest/).
+
+На PostgreSQL ищем через pg_trgm: триграммный GIN-индекс по названиям
+товаров и категорий прощает опечатки ("хризантемма", "пеоны").
+Фильтр только через оператор pg_trgm (trigram_word_similar -> %>): icontains
+превращается в UPPER(name) LIKE, и индекс gin_trgm_ops для него не работает.
+Если триграмм нет (SQLite в разработке), работает индекс префиксов слов
+в памяти процесса.
+"""
+
+import bisect
+import time
+
+from django.db import connection
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.urls import reverse
+
+from .models import Category, Product
+
+SUGGEST_LIMIT = 8
+CATEGORY_LIMIT = 3
+MIN_QUERY_LENGTH = 2
+
+# Через сколько секунд индекс в памяти пересобирается сам
+# (изменения из других процессов сигналы сюда не приносят)
+PREFIX_INDEX_TTL = 300
+
+_trigram_available = None
+
+
+def normalize(text):
+    return (text or '').lower().replace('ё', 'е').strip()
+
+
+def trigram_available():
+    """Есть ли pg_trgm в текущей БД (проверяется один раз на процесс)."""
+    global _trigram_available
+    if _trigram_available is None:
+        _trigram_available = False
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                _trigram_available = cursor.fetchone() is not None
+    return _trigram_available
+
+
+def _product_item(product_id, name, slug, price):
+    return {
+        'id': product_id,
+        'name': name,
+        'price': str(price),
+        'url': reverse('shop:product_detail', args=[product_id, slug]),
+    }
+
+
+def _category_item(name, slug):
+    return {
+        'name': name,
+        'url': reverse('shop:product_list_by_category', args=[slug]),
+    }
+
+
+# === PostgreSQL: pg_trgm ===
+
+def _trigram_suggest(query):
+    from django.contrib.postgres.search import TrigramWordSimilarity
+
+    products = (
+        Product.objects.filter(available=True, name__trigram_word_similar=query)
+        .annotate(similarity=TrigramWordSimilarity(query, 'name'))
+        .order_by('-similarity', 'name')
+        .values_list('id', 'name', 'slug', 'price')[:SUGGEST_LIMIT]
+    )
+    categories = (
+        Category.objects.filter(name__trigram_word_similar=query)
+        .annotate(similarity=TrigramWordSimilarity(query, 'name'))
+        .order_by('-similarity', 'order')
+        .values_list('name', 'slug')[:CATEGORY_LIMIT]
+    )
+    return {
+        'products': [_product_item(*row) for row in products],
+        'categories': [_category_item(*row) for row in categories],
+    }
+
+
+# === Запасной вариант: префиксы слов в памяти ===
+
+class PrefixIndex:
+    """Отсортированный список (слово, тип, ключ) для поиска по префиксу через bisect."""
+
+    def __init__(self):
+        self.words = []
+        self.entries = []
+        self.products = {}
+        self.categories = {}
+        self.built_at = None
+
+    def build(self):
+        pairs = []
+        products = {}
+        categories = {}
+
+        for product_id, name, slug, price in Product.objects.filter(available=True).values_list(
+                'id', 'name', 'slug', 'price'):
+            products[product_id] = _product_item(product_id, name, slug, price)
+            for word in normalize(name).split():
+                pairs.append((word, 'product', product_id))
+
+        for category_id, name, slug in Category.objects.values_list('id', 'name', 'slug'):
+            categories[category_id] = _category_item(name, slug)
+            for word in normalize(name).split():
+                pairs.append((word, 'category', category_id))
+
+        pairs.sort()
+        self.words = [pair[0] for pair in pairs]
+        self.entries = pairs
+        self.products = products
+        self.categories = categories
+        self.built_at = time.monotonic()
+
+    def is_stale(self):
+        return self.built_at is None or time.monotonic() - self.built_at > PREFIX_INDEX_TTL
+
+    def search(self, query):
+        words = normalize(query).split()
+        if not words:
+            return {'products': [], 'categories': []}
+
+        # Каждое слово запроса должно быть префиксом какого-то слова в названии
+        matches = None
+        for word in words:
+            found = set()
+            start = bisect.bisect_left(self.words, word)
+            for index in range(start, len(self.words)):
+                if not self.words[index].startswith(word):
+                    break
+                found.add(self.entries[index][1:])
+            matches = found if matches is None else matches & found
+
+        products = sorted(
+            (self.products[key] for kind, key in matches if kind == 'product'),
+            key=lambda item: item['name']
+        )
+        categories = sorted(
+            (self.categories[key] for kind, key in matches if kind == 'category'),
+            key=lambda item: item['name']
+        )
+        return {'products': products[:SUGGEST_LIMIT], 'categories': categories[:CATEGORY_LIMIT]}
+
+
+prefix_index = PrefixIndex()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def _invalidate_prefix_index(**kwargs):
+    prefix_index.built_at = None
+
+
+def suggest(query):
+    """Подсказки для строки запроса: {'products': [...], 'categories': [...]}."""
+    query = (query or '').strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        return {'products': [], 'categories': []}
+
+    if trigram_available():
+        return _trigram_suggest(query)
+
+    if prefix_index.is_stale():
+        prefix_index.build()
+    return prefix_index.search(query)
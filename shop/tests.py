@@ -1,3 +1,332 @@
-from django.test import TestCase
+import datetime
+import tempfile
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from orders.models import Order, OrderEvent, OrderItem
+from . import renumbering, search, settings_cache, suggest
+from .models import Category, Product, SiteSettings
+from .pagination import decode_cursor, encode_cursor, keyset_page
+
+# Тесты не трогают общий кэш проекта (файлы на диске или Redis) и его медиа:
+# SiteSettings.save() собирает тему в MEDIA_ROOT и после коммита удаляет старые файлы
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+TEST_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=TEST_MEDIA_ROOT)
+class SettingsCacheTest(TestCase):
+
+    def setUp(self):
+        settings_cache.invalidate()
+
+    def tearDown(self):
+        settings_cache.invalidate()
+
+    def test_new_row_is_reloaded_from_db(self):
+        site_settings = SiteSettings.get_solo()
+
+        self.assertIsInstance(site_settings.delivery_weekdays_open, datetime.time)
+
+    def test_version_changes_only_after_commit(self):
+        site_settings = SiteSettings.get_solo()
+        version = settings_cache.current_version()
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            site_settings.save()
+        self.assertEqual(settings_cache.current_version(), version)
+
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(settings_cache.current_version(), version)
+        self.assertIsInstance(SiteSettings.get_solo().delivery_weekdays_open, datetime.time)
+
+
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=TEST_MEDIA_ROOT)
+class ThemeTest(TestCase):
+
+    def tearDown(self):
+        settings_cache.invalidate()
+
+    def test_old_theme_is_removed_after_commit(self):
+        site_settings = SiteSettings.get_solo()
+        site_settings.save()
+        old_name = site_settings.theme_stylesheet
+
+        site_settings.mobile_font_scale = (site_settings.mobile_font_scale or 0) + 1
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            site_settings.save()
+        self.assertNotEqual(site_settings.theme_stylesheet, old_name)
+        self.assertTrue(default_storage.exists(old_name))
+
+        for callback in callbacks:
+            callback()
+        self.assertFalse(default_storage.exists(old_name))
+        self.assertTrue(default_storage.exists(site_settings.theme_stylesheet))
+
+
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=TEST_MEDIA_ROOT)
+class RenumberOrdersTest(TestCase):
+
+    def test_events_follow_renumbered_orders(self):
+        orders = [
+            Order.objects.create(first_name='Анна', last_name='Иванова', email='anna@example.com',
+                                 phone='+79990000000', address='ул. Ленина, 1', city='Москва')
+            for i in range(3)
+        ]
+        for order in orders:
+            OrderEvent.objects.create(order=order, kind=OrderEvent.CREATED, payload={'number': order.id})
+
+        self.assertEqual(renumbering.renumber_orders(start=1000), 3)
+
+        self.assertEqual(sorted(Order.objects.values_list('id', flat=True)), [1000, 1001, 1002])
+        self.assertEqual(sorted(OrderEvent.objects.values_list('order_id', flat=True)), [1000, 1001, 1002])
+
+    def test_renumber_skus_refreshes_order_search(self):
+        product = Product.objects.create(name='Букет роз', slug='buket-roz', price='2500.00', stock=10)
+        order = Order.objects.create(first_name='Анна', phone='+79990000000')
+        OrderItem.objects.create(order=order, product=product, price=product.price, quantity=1)
+        order.recalculate_totals()
+
+        renumbering.renumber_skus(start=500)
+
+        self.assertEqual(Order.objects.get(pk=order.pk).items_search, 'Букет роз 500')
+
+
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=TEST_MEDIA_ROOT)
+class RenumberJobTest(TestCase):
+
+    def setUp(self):
+        cache.delete(renumbering.JOB_CACHE_PREFIX + renumbering.SKUS)
+
+    def test_job_is_queued_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.assertTrue(renumbering.start_job(renumbering.SKUS))
+        self.assertEqual(len(callbacks), 1)
+        self.assertTrue(renumbering.is_running(renumbering.SKUS))
+
+        with self.captureOnCommitCallbacks(execute=False):
+            self.assertFalse(renumbering.start_job(renumbering.SKUS))
+
+    def test_stale_job_can_be_restarted(self):
+        renumbering._set_status(renumbering.SKUS, 'dead', 'running', 'Обновление артикулов', 1, 1)
+        status = renumbering.get_status(renumbering.SKUS)
+        status['updated'] = timezone.now() - datetime.timedelta(minutes=renumbering.STALE_MINUTES + 1)
+        cache.set(renumbering.JOB_CACHE_PREFIX + renumbering.SKUS, status)
+
+        with self.captureOnCommitCallbacks(execute=False):
+            self.assertTrue(renumbering.start_job(renumbering.SKUS))
+        # Задача упавшего воркера, если все же дойдет до выполнения, ничего не делает
+        self.assertEqual(renumbering.run_job(renumbering.SKUS, 'dead'), 0)
+
+
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=TEST_MEDIA_ROOT)
+class SkuTest(TestCase):
+
+    def make_product(self, slug, **kwargs):
+        return Product.objects.create(name='Букет', slug=slug, price='1500.00', stock=1, **kwargs)
+
+    def test_manual_sku_change_is_not_reissued(self):
+        product = Product.objects.get(pk=self.make_product('first').pk)
+        product.sku = str(int(product.sku) + 10)
+        product.save()
+
+        self.assertEqual(self.make_product('second').sku, str(int(product.sku) + 1))
+
+
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=TEST_MEDIA_ROOT)
+class SearchCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        search.product_index.built_at = None
+        self.product = Product.objects.create(name='Букет роз', slug='buket-roz', price='2500.00', stock=10)
+
+    def test_stock_save_does_not_query_search_fields(self):
+        product = Product.objects.get(pk=self.product.pk)
+        product.stock = 5
+        with CaptureQueriesContext(connection) as queries:
+            product.save(update_fields=['stock'])
+            product.save()
+        self.assertFalse([q for q in queries if q['sql'].startswith('SELECT')])
+
+    def test_rename_invalidates_results(self):
+        self.assertEqual(search.cached_search('розы'), [self.product.id])
+
+        product = Product.objects.only('id', 'stock').get(pk=self.product.pk)
+        product.name = 'Букет тюльпанов'
+        product.save()
+
+        self.assertEqual(search.cached_search('розы'), [])
+        self.assertEqual(search.cached_search('тюльпанов'), [self.product.id])
+
+    def test_results_follow_index_build(self):
+        self.assertEqual(search.cached_search('розы'), [self.product.id])
+
+        # Изменение из другого процесса: сигналов нет, версии основ прежние
+        Product.objects.filter(pk=self.product.pk).update(name='Букет тюльпанов')
+        self.assertEqual(search.cached_search('розы'), [self.product.id])
+
+        # Пересобранный индекс не берет выдачу старой сборки из общего кэша
+        search.product_index.build()
+        self.assertEqual(search.cached_search('розы'), [])
+
+
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=TEST_MEDIA_ROOT)
+class PythonSearchTest(TestCase):
+    """Стемминг, ранжирование BM25 и подсветка индекса в памяти."""
+
+    def setUp(self):
+        cache.clear()
+        search.product_index.built_at = None
+        self.mixed = Product.objects.create(
+            name='Букет тюльпанов', slug='buket-tyulpanov', price='1800.00', stock=10,
+            description='Тюльпаны и одна роза',
+        )
+        self.roses = Product.objects.create(
+            name='Букет роз', slug='buket-roz', price='2500.00', stock=10,
+            description='Розы алые, розы белые',
+        )
+
+    def test_stem(self):
+        self.assertEqual(search.stem('розы'), search.stem('роза'))
+        self.assertEqual(search.stem('розами'), search.stem('роз'))
+        self.assertNotEqual(search.stem('розы'), search.stem('тюльпаны'))
+
+    def test_ranks_by_term_frequency(self):
+        self.assertEqual(search.PythonSearchBackend().search('роза'), [self.roses.id, self.mixed.id])
+        self.assertEqual(search.PythonSearchBackend().search('тюльпан'), [self.mixed.id])
+
+    def test_highlight(self):
+        product = search.PythonSearchBackend().highlight(Product.objects.filter(pk=self.mixed.pk), 'розы')[0]
+        self.assertEqual(product.highlighted_description, 'Тюльпаны и одна <mark>роза</mark>')
+        self.assertEqual(product.highlighted_name, 'Букет тюльпанов')
+
+    def test_search_results_view(self):
+        response = self.client.get(reverse('shop:search_results'), {'q': 'розы'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_count'], 2)
+        self.assertEqual([product.id for product in response.context['products']], [self.roses.id, self.mixed.id])
+
+
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=TEST_MEDIA_ROOT)
+class CatalogCardsQueryCountTest(TestCase):
+    """Карточки каталога собираются за постоянное число запросов."""
+
+    def setUp(self):
+        settings_cache.invalidate()
+        SiteSettings.get_solo()
+
+    def tearDown(self):
+        settings_cache.invalidate()
+
+    def create_products(self, count):
+        for i in range(count):
+            Product.objects.create(name=f'Букет {Product.objects.count()}', slug=f'buket-{i}',
+                                   price='1500.00', old_price='2000.00', stock=10)
+
+    def catalog_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('shop:product_list_all'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_is_constant(self):
+        self.create_products(2)
+        self.catalog_queries()
+        few = self.catalog_queries()
+        self.create_products(8)
+
+        self.assertEqual(self.catalog_queries(), few)
+
+
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=TEST_MEDIA_ROOT)
+class KeysetPaginationTest(TestCase):
+    """Страницы каталога по курсору: без пропусков и повторов при равных ключах сортировки."""
+
+    def setUp(self):
+        prices = ['1000.00', '1500.00', '1500.00', '1500.00', '1500.00', '2000.00', '2500.00']
+        for i, price in enumerate(prices):
+            Product.objects.create(name=f'Букет {i}', slug=f'buket-{i}', price=price, stock=i % 2)
+        self.products = list(Product.objects.order_by('id'))
+
+    def all_pages(self, sort, page_size=2):
+        ids, cursor = [], None
+        while True:
+            products, cursor = keyset_page(Product.objects.all(), sort, cursor, page_size)
+            ids.extend(product.id for product in products)
+            if not cursor:
+                return ids
+
+    def test_pages_across_equal_sort_keys(self):
+        expected = [p.id for p in sorted(self.products, key=lambda p: (p.price, p.id))]
+        self.assertEqual(self.all_pages('price'), expected)
+
+        expected = [p.id for p in sorted(self.products, key=lambda p: (p.price, p.id), reverse=True)]
+        self.assertEqual(self.all_pages('price_desc'), expected)
+
+    def test_tampered_cursor_starts_from_first_page(self):
+        cursor = encode_cursor('price', self.products[0])
+
+        self.assertIsNone(decode_cursor('price', cursor[:-3] + 'xyz'))
+        self.assertIsNone(decode_cursor('price', 'не base64'))
+        self.assertIsNone(decode_cursor('new', cursor))
+
+        first_page, _ = keyset_page(Product.objects.all(), 'price', None, 2)
+        page, _ = keyset_page(Product.objects.all(), 'price', 'bad' + cursor, 2)
+        self.assertEqual(page, first_page)
+
+    def test_filters_with_sort(self):
+        url = reverse('shop:product_list_all')
+        params = {'format': 'json', 'sort': 'price_desc', 'price_min': '1500', 'price_max': '2000', 'in_stock': '1'}
+
+        data = self.client.get(url, params).json()
+
+        expected = [p for p in self.products if p.stock and 1500 <= p.price <= 2000]
+        self.assertEqual(data['count'], len(expected))
+        self.assertIsNone(data['next_cursor'])
+        positions = [data['html'].index(p.get_absolute_url()) for p in sorted(
+            expected, key=lambda p: (p.price, p.id), reverse=True)]
+        self.assertEqual(positions, sorted(positions))
+
+
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=TEST_MEDIA_ROOT)
+class SuggestTest(TestCase):
+    """Без pg_trgm (SQLite) подсказки идут из индекса префиксов в памяти."""
+
+    def setUp(self):
+        suggest.prefix_index.built_at = None
+        self.peonies = Product.objects.create(name='Пионы розовые', slug='piony', price='3000.00', stock=5)
+        Product.objects.create(name='Хризантема', slug='hrizantema', price='900.00', stock=5)
+        Product.objects.create(name='Пион снятый', slug='pion-off', price='100.00', stock=5, available=False)
+        Category.objects.create(name='Пионы', slug='piony')
+
+    def get(self, query):
+        response = self.client.get(reverse('shop:search_suggest'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_prefix_fallback(self):
+        self.assertFalse(suggest.trigram_available())
+
+        data = self.get('пио')
+        self.assertEqual([item['id'] for item in data['products']], [self.peonies.id])
+        self.assertEqual([item['name'] for item in data['categories']], ['Пионы'])
+
+        # Каждое слово запроса - префикс слова в названии
+        self.assertEqual([item['id'] for item in self.get('роз пи')['products']], [self.peonies.id])
+        self.assertEqual(self.get('пионы белые')['products'], [])
+        self.assertEqual(self.get('п'), {'products': [], 'categories': []})
+
+    def test_index_follows_saves(self):
+        self.assertEqual(self.get('тюл')['products'], [])
+
+        tulips = Product.objects.create(name='Тюльпаны', slug='tyulpany', price='1200.00', stock=5)
+        self.assertEqual([item['id'] for item in self.get('тюл')['products']], [tulips.id])
@@ -0,0 +1,58 @@
+# shop/theme.py
+
+"""
+Сборка CSS-темы сайта из SiteSettings.
+
+Шаблон shop/theme.css рендерится один раз при сохранении настроек и
+записывается в MEDIA_ROOT/theme/theme.<хэш>.css. Имя файла зависит от
+содержимого, поэтому браузер может кэшировать его бессрочно.
+
+Старые файлы удаляются только после коммита сохранения настроек: пока
+транзакция не завершена (или откатилась), страницы ссылаются на прежний файл.
+"""
+
+import hashlib
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.template.loader import render_to_string
+
+THEME_TEMPLATE = 'shop/theme.css'
+THEME_DIR = 'theme'
+
+
+def render_theme(site_settings):
+    """Рендерит CSS темы в строку."""
+    return render_to_string(THEME_TEMPLATE, {'site_settings': site_settings})
+
+
+def compile_theme(site_settings):
+    """
+    Собирает файл темы и возвращает его путь в хранилище медиа.
+    Старые версии файла удаляются после коммита транзакции.
+    """
+    content = render_theme(site_settings).encode('utf-8')
+    digest = hashlib.md5(content).hexdigest()[:12]
+    name = f'{THEME_DIR}/theme.{digest}.css'
+
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(content))
+
+    transaction.on_commit(lambda: _remove_old_themes(site_settings, name))
+    return name
+
+
+def _remove_old_themes(site_settings, name):
+    # Файл, на который ссылается строка в БД, не трогаем: его могло записать
+    # другое сохранение, закоммиченное позже нашего
+    current = type(site_settings).objects.filter(pk=site_settings.pk).values_list('theme_stylesheet', flat=True).first()
+    keep = {name, current}
+    try:
+        _, files = default_storage.listdir(THEME_DIR)
+    except FileNotFoundError:
+        return
+    for filename in files:
+        path = f'{THEME_DIR}/{filename}'
+        if path not in keep:
+            default_storage.delete(path)
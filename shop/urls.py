@@ -16,6 +16,7 @@ urlpatterns = [
 
     # === ПОИСК И AJAX ===
     path('search/', views.search_results, name='search_results'),
+    path('search/suggest/', views.search_suggest, name='search_suggest'),
     path('get-product-price/', views.get_product_price, name='get_product_price'),
 
     # === ЛИЧНЫЙ КАБИНЕТ ===
@@ -5,67 +5,74 @@ from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
+from django.db import transaction
 from django.http import JsonResponse, Http404
+from django.template.loader import render_to_string
+from django.middleware.csrf import get_token
 
-# Импорты для поиска (PostgreSQL)
-from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank, SearchHeadline
+from django.core.paginator import Paginator
 
 # Импорты моделей
 from .models import Category, Product, SiteSettings, FooterPage, Banner, Benefit
-from orders.models import Order
+from orders.models import Order, OrderEvent
+from orders import holds, outbox, stock
+from .cards import build_product_cards
+from .pagination import SORT_OPTIONS, apply_filters, get_sort, keyset_page
+from .search import cached_search, get_backend as get_search_backend
+from .suggest import suggest
+from favorites.favorites import Favorites
 
 # Импорты форм
 from cart.forms import CartAddProductForm
 from users.forms import UserEditForm, ProfileEditForm
 
-# Для асинхронных задач
-from django_q.tasks import async_task
+SEARCH_PAGE_SIZE = 24
 
 
 def search_results(request):
     """
-    Поиск товаров с использованием полнотекстового поиска PostgreSQL.
-    Ищет по названию, описанию и составу.
+    Поиск товаров через движок из shop.search (PostgreSQL FTS или индекс в памяти).
+    Список id берется из кэша, если такой запрос уже ранжировали.
+    Подсветка считается только для товаров текущей страницы.
     """
     query = request.GET.get('q', '').strip()
-    products = Product.objects.none()
+    products = []
+    page = None
 
     if query:
-        # Настройка векторов поиска
-        search_vector = SearchVector('name', 'description', 'composition', config='russian')
-        search_query = SearchQuery(query, config='russian')
-
-        products = (
-            Product.objects.annotate(
-                rank=SearchRank(search_vector, search_query),
-                highlighted_name=SearchHeadline(
-                    'name',
-                    search_query,
-                    start_sel='<mark>',
-                    stop_sel='</mark>',
-                    config='russian'
-                ),
-                highlighted_description=SearchHeadline(
-                    'description',
-                    search_query,
-                    start_sel='<mark>',
-                    stop_sel='</mark>',
-                    config='russian'
-                ),
-            )
-            .filter(available=True)
-            .filter(rank__gte=0.05)
-            .order_by('-rank')
-        )
-
-    return render(request, 'shop/search_results.html', {'query': query, 'products': products})
+        backend = get_search_backend()
+
+        # 1. Ранжирование: только id, без тяжелых полей (из кэша, если есть)
+        ranked_ids = cached_search(query)
+        page = Paginator(ranked_ids, SEARCH_PAGE_SIZE).get_page(request.GET.get('page'))
+        page_ids = list(page.object_list)
+
+        # 2. Подсветка только для показываемой страницы
+        page_products = backend.highlight(Product.objects.filter(id__in=page_ids), query)
+        positions = {product_id: index for index, product_id in enumerate(page_ids)}
+        products = sorted(page_products, key=lambda p: positions[p.id])
+
+    return render(request, 'shop/search_results.html', {
+        'query': query,
+        'products': build_product_cards(products),
+        'page_obj': page,
+        'total_count': page.paginator.count if page else 0,
+    })
+
+
+def search_suggest(request):
+    """
+    Подсказки для строки поиска в шапке (JSON, вызывается на каждое нажатие).
+    Терпит опечатки за счет триграмм pg_trgm.
+    """
+    return JsonResponse(suggest(request.GET.get('q', '')))
 
 
 def home_page(request):
     """
     Главная страница: баннеры и избранные товары.
     """
-    featured_products = Product.objects.filter(is_featured=True, available=True)[:8]
+    featured_products = build_product_cards(Product.objects.filter(is_featured=True, available=True)[:8])
     banners = Banner.objects.filter(is_active=True).order_by('order')
 
     return render(request, 'shop/home.html', {
@@ -74,12 +81,44 @@ def home_page(request):
     })
 
 
+def _catalog_page(request, queryset, current_category):
+    """
+    Общая логика каталога: фильтры, сортировка и страница по курсору.
+    С ?format=json отдает HTML следующих карточек для бесконечной прокрутки.
+    """
+    sort = get_sort(request.GET)
+    queryset = apply_filters(queryset, request.GET)
+    products, next_cursor = keyset_page(queryset, sort, request.GET.get('cursor'))
+    products = build_product_cards(products)
+
+    if request.GET.get('format') == 'json':
+        html = render_to_string('shop/includes/product_grid_items.html', {
+            'products': products,
+            'favorites': Favorites(request),
+            'csrf_token': get_token(request),
+        })
+        return JsonResponse({'html': html, 'next_cursor': next_cursor, 'count': len(products)})
+
+    # Параметры фильтров без курсора и сортировки - для ссылок в шаблоне
+    filter_params = request.GET.copy()
+    for key in ('cursor', 'sort', 'format'):
+        filter_params.pop(key, None)
+
+    return render(request, 'shop/product_list.html', {
+        'current_category': current_category,
+        'products': products,
+        'next_cursor': next_cursor,
+        'current_sort': sort,
+        'sort_options': [(key, option[2]) for key, option in SORT_OPTIONS.items()],
+        'filter_query': filter_params.urlencode(),
+    })
+
+
 def product_list_all(request):
     """
     Каталог: Все товары.
     """
-    products = Product.objects.filter(available=True)
-    return render(request, 'shop/product_list.html', {'current_category': None, 'products': products})
+    return _catalog_page(request, Product.objects.filter(available=True), None)
 
 
 def product_list_by_category(request, category_slug):
@@ -87,8 +126,7 @@ def product_list_by_category(request, category_slug):
     Каталог: Товары конкретной категории.
     """
     category = get_object_or_404(Category, slug=category_slug)
-    products = Product.objects.filter(available=True, category__slug=category_slug)
-    return render(request, 'shop/product_list.html', {'current_category': category, 'products': products})
+    return _catalog_page(request, Product.objects.filter(available=True, category=category), category)
 
 
 def product_detail(request, id, slug):
@@ -106,7 +144,9 @@ def product_detail(request, id, slug):
     return render(request, 'shop/product_detail.html', {
         'product': product,
         'cart_product_form': cart_product_form,
-        'benefits': benefits
+        'benefits': benefits,
+        # Остаток за вычетом броней других покупателей (orders/holds.py)
+        'free_stock': holds.free_stock(product, holds.owner_for(request)),
     })
 
 
@@ -223,21 +263,21 @@ def cancel_order(request, order_id):
     Отмена заказа пользователем.
     Возвращает товары на склад и отправляет уведомление админу.
     """
-    order = get_object_or_404(Order, id=order_id, user=request.user)
-
-    if order.can_be_cancelled:
-        # Возвращаем товары на склад
-        for item in order.items.all():
-            item.product.stock += item.quantity
-            item.product.save()
+    with transaction.atomic():
+        # Блокируем заказ: двойной клик не вернет товары на склад дважды
+        order = get_object_or_404(Order.objects.select_for_update(), id=order_id, user=request.user)
+        cancelled = order.can_be_cancelled
+        if cancelled:
+            # Возвращаем товары на склад одним UPDATE
+            stock.release({item.product_id: item.quantity for item in order.items.all()})
 
-        order.status = 'cancelled'
-        order.save()
+            order.status = 'cancelled'
+            order.save()
 
-        # Отправка письма админу асинхронно
-        base_url = f"{request.scheme}://{request.get_host()}"
-        async_task('orders.utils.send_cancellation_email_task', order_id=order.id, base_url=base_url)
+            # Письмо админу - через исходящую очередь после коммита
+            outbox.record(order, OrderEvent.CANCELLED, base_url=f"{request.scheme}://{request.get_host()}")
 
+    if cancelled:
         messages.success(request, f'Заказ #{order.id} успешно отменен.')
     else:
         messages.error(request, 'Этот заказ уже нельзя отменить (он уже отправлен или доставлен).')